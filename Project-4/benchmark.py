@@ -0,0 +1,282 @@
+"""Benchmarks for the decision tree and random forest code in submission.py.
+
+Times load_csv, DecisionTree.fit/classify, RandomForest.fit/classify,
+generate_k_folds and the metric functions on synthetic datasets of growing
+rows, features and depth. Reports throughput (rows/s), peak memory and the
+scaling exponent of time against rows, and compares against a stored
+baseline:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json
+
+--kernels runs the loop vs vectorized kernel pairs of
+submission.Vectorization instead.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import submission
+
+
+# Dataset shapes per suite size: rows, features and tree depths.
+SIZES = {
+    'quick': {'rows': [1000, 4000], 'features': [8], 'depths': [4, 8]},
+    'full': {'rows': [2000, 8000, 32000], 'features': [8, 32], 'depths': [4, 8, 16]},
+}
+
+
+def make_dataset(rows, features, n_classes=2, seed=0):
+    """Draw a reproducible classification problem.
+    Labels come from random linear scores of the features plus noise, so
+    trees of every depth have something to learn.
+    Args:
+        rows (int): number of examples.
+        features (int): number of features.
+        n_classes (int): number of classes.
+        seed (int): random seed.
+    Returns:
+        Tuple (features (rows x features), classes (rows,)).
+    """
+
+    rng = np.random.default_rng(seed)
+    data = rng.normal(size=(rows, features))
+    scores = data @ rng.normal(size=(features, n_classes)) + rng.normal(scale=0.5,
+                                                                        size=(rows, n_classes))
+    return data, np.argmax(scores, axis=1)
+
+
+def measure(function, repeat):
+    """Time function and record its peak traced memory.
+    After a warm-up call, the number of calls per sample is chosen like
+    timeit's autorange, so every sample lasts at least 0.2 seconds and
+    fast functions are not timed at the clock's resolution. The timing
+    runs go without tracemalloc, which slows numpy down; one extra call
+    measures the peak.
+    Args:
+        function (func): callable without arguments.
+        repeat (int): number of timed samples.
+    Returns:
+        Tuple (best seconds per call, median seconds per call, calls per
+        sample, peak bytes).
+    """
+
+    function()
+    timer = timeit.Timer(function)
+    loops, _ = timer.autorange()
+    times = [seconds / loops for seconds in timer.repeat(repeat, loops)]
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), float(np.median(times)), loops, peak
+
+
+def cases(size, workdir, only=None):
+    """Yield the benchmarks of a suite size.
+    Setup work (CSV files, the models fitted for classify) is done only
+    for the benchmarks selected by only.
+    Args:
+        size (str): key of SIZES.
+        workdir (str): directory for the CSV files of load_csv.
+        only (str): yield only benchmarks whose name contains this.
+    Yields:
+        Tuple (benchmark name, params dict, rows processed, callable).
+    """
+
+    def wanted(name):
+        return not only or only in name
+
+    shape = SIZES[size]
+    for rows in shape['rows']:
+        for n_features in shape['features']:
+            features, classes = make_dataset(rows, n_features)
+            params = {'rows': rows, 'features': n_features}
+
+            if wanted('load_csv'):
+                path = os.path.join(workdir, 'data_{}_{}.csv'.format(rows, n_features))
+                np.savetxt(path, np.column_stack((features, classes)), delimiter=',', fmt='%.6g')
+                yield 'load_csv', params, rows, lambda path=path: submission.load_csv(path)
+
+            for depth in shape['depths']:
+                depth_params = dict(params, depth=depth)
+                tree = submission.DecisionTree(depth)
+                if wanted('DecisionTree.fit'):
+                    yield ('DecisionTree.fit', depth_params, rows,
+                           lambda tree=tree, x=features, y=classes: tree.fit(x, y))
+                if wanted('DecisionTree.classify'):
+                    tree.fit(features, classes)
+                    yield ('DecisionTree.classify', depth_params, rows,
+                           lambda tree=tree, x=features: tree.classify(x))
+
+                forest = submission.RandomForest(num_trees=10, depth_limit=depth, random_state=0)
+                if wanted('RandomForest.fit'):
+                    yield ('RandomForest.fit', depth_params, rows,
+                           lambda forest=forest, x=features, y=classes: forest.fit(x, y))
+                if wanted('RandomForest.classify'):
+                    forest.fit(features, classes)
+                    yield ('RandomForest.classify', depth_params, rows,
+                           lambda forest=forest, x=features: forest.classify(x))
+
+            if wanted('generate_k_folds'):
+                dataset = (features, classes)
+                yield ('generate_k_folds', params, rows,
+                       lambda dataset=dataset: submission.generate_k_folds(dataset, 10))
+
+        output = np.random.default_rng(1).integers(0, 2, rows)
+        labels = np.random.default_rng(2).integers(0, 2, rows)
+        metric_params = {'rows': rows}
+        metrics = [
+            ('confusion_matrix', lambda: submission.confusion_matrix(output, labels)),
+            ('classification_metrics', lambda: submission.classification_metrics(output, labels)),
+            ('precision+recall+accuracy',
+             lambda: (submission.precision(output, labels), submission.recall(output, labels),
+                      submission.accuracy(output, labels))),
+        ]
+        for name, function in metrics:
+            if wanted(name):
+                yield name, metric_params, rows, function
+
+
+def run(size='quick', repeat=3, only=None):
+    """Run a benchmark suite.
+    Args:
+        size (str): key of SIZES.
+        repeat (int): timed runs per benchmark.
+        only (str): run only benchmarks whose name contains this.
+    Returns:
+        List of result dicts (benchmark, params, seconds, median_seconds,
+        loops, rows_per_second, peak_bytes).
+    """
+
+    np.random.seed(0)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, params, rows, function in cases(size, workdir, only):
+            best, median, loops, peak = measure(function, repeat)
+            results.append({'benchmark': name, 'params': params, 'seconds': best,
+                            'median_seconds': median, 'loops': loops,
+                            'rows_per_second': rows / best, 'peak_bytes': peak})
+    return results
+
+
+def key(result):
+    """Identify a result across runs, e.g. 'DecisionTree.fit depth=4 features=8 rows=1000'."""
+
+    return ' '.join([result['benchmark']] + ['{}={}'.format(name, value)
+                                             for name, value in sorted(result['params'].items())])
+
+
+def scaling(results):
+    """Fit time ~ rows ** exponent for every benchmark and remaining params.
+    Returns:
+        Dict of key (without rows) to the log-log slope of seconds on rows;
+        1 means linear scaling.
+    """
+
+    curves = {}
+    for result in results:
+        params = {name: value for name, value in result['params'].items() if name != 'rows'}
+        curve = key({'benchmark': result['benchmark'], 'params': params})
+        curves.setdefault(curve, []).append((result['params']['rows'], result['seconds']))
+    exponents = {}
+    for curve, points in curves.items():
+        if len(points) > 1:
+            rows, seconds = np.log(points).T
+            exponents[curve] = float(np.polyfit(rows, seconds, 1)[0])
+    return exponents
+
+
+def compare(results, baseline, tolerance, min_slowdown=1e-3):
+    """Compare timings against a baseline run.
+    Args:
+        results (list): current results.
+        baseline (list): results of the baseline run.
+        tolerance (float): slowdown ratio tolerated before a regression.
+        min_slowdown (float): seconds per call a benchmark must also lose
+            to count as a regression, so jitter on fast benchmarks does not.
+    Returns:
+        Tuple (list of (key, baseline seconds, seconds, ratio), list of
+        regressed keys).
+    """
+
+    previous = {key(result): result['seconds'] for result in baseline}
+    rows, regressions = [], []
+    for result in results:
+        if key(result) not in previous:
+            continue
+        ratio = result['seconds'] / previous[key(result)]
+        rows.append((key(result), previous[key(result)], result['seconds'], ratio))
+        if ratio > tolerance and result['seconds'] - previous[key(result)] > min_slowdown:
+            regressions.append(key(result))
+    return rows, regressions
+
+
+def run_kernels(repeat):
+    """Print the Vectorization kernel benchmark; fail if a pair disagrees."""
+
+    results = submission.Vectorization().benchmark(repeat=repeat)
+    for result in results:
+        print('{:<20} {:<12} {:<8} {:>10.5f}s {:>10.5f}s  x{:<8.1f} {:>10.1f} KiB {}'.format(
+            result['kernel'], 'x'.join(map(str, result['shape'])), result['dtype'],
+            result['loop_seconds'], result['vectorized_seconds'], result['speedup'],
+            result['vectorized_peak_bytes'] / 2**10, 'ok' if result['equal'] else 'MISMATCH'))
+    return 0 if all(result['equal'] for result in results) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='quick')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='run only benchmarks whose name contains this')
+    parser.add_argument('--save', help='write the results as JSON, e.g. a new baseline')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='slowdown ratio reported as a regression')
+    parser.add_argument('--min-slowdown', type=float, default=1e-3,
+                        help='seconds per call a regression must also lose')
+    parser.add_argument('--kernels', action='store_true',
+                        help='run the Vectorization kernel pairs instead')
+    args = parser.parse_args(argv)
+
+    if args.kernels:
+        return run_kernels(args.repeat)
+
+    results = run(args.size, args.repeat, args.only)
+    for result in results:
+        print('{:<60} {:>10.6f}s {:>14,.0f} rows/s {:>10.1f} MiB'.format(
+            key(result), result['seconds'], result['rows_per_second'],
+            result['peak_bytes'] / 2**20))
+    curves = scaling(results)
+    if curves:
+        print('\nscaling exponent of time in rows (1 = linear)')
+        for curve, exponent in curves.items():
+            print('{:<60} {:>6.2f}'.format(curve, exponent))
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump({'size': args.size, 'results': results, 'scaling': curves}, handle, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)['results']
+        rows, regressions = compare(results, baseline, args.tolerance, args.min_slowdown)
+        print('\ncompared with {}'.format(args.baseline))
+        for name, before, after, ratio in rows:
+            print('{:<60} {:>10.6f}s -> {:>10.6f}s  x{:.2f}'.format(name, before, after, ratio))
+        if regressions:
+            print('\n{} regression(s) slower than x{}'.format(len(regressions), args.tolerance))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
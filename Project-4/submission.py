@@ -1,3 +1,21 @@
+import hashlib
+import heapq
+import inspect
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import tracemalloc
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from itertools import islice
+from multiprocessing import shared_memory
+
 import numpy as np
 from collections import Counter
 import time
@@ -32,43 +50,241 @@ class DecisionNode:
             Class label if a leaf node, otherwise a child node.
         """
 
-        if self.class_label is not None:
-            return self.class_label
+        node = self
+        while node.class_label is None:
+            node = node.left if node.decision_function(feature) else node.right
+        return node.class_label
+
+
+# Number of text rows parsed at a time by the CSV loaders.
+_CSV_CHUNK_ROWS = 65536
+
+
+def _class_column(class_index, n_columns):
+    """Return class_index as a column number in range(n_columns).
+    Raises:
+        IndexError: unless -n_columns <= class_index < n_columns.
+    """
+
+    if not -n_columns <= class_index < n_columns:
+        raise IndexError('class_index {} is out of range for {} columns'.format(class_index,
+                                                                            n_columns))
+    return class_index % n_columns
+
+
+def _split_class_column(out, class_index):
+    """Split a loaded block into features and classes.
+    Args:
+        out (m x c): parsed rows.
+        class_index (int): column holding the class, or None for no split.
+    Returns:
+        features, classes views of out, or out itself if class_index is None.
+    """
+
+    if class_index is None:
+        return out
+    if not out.shape[1]:
+        # an empty file has no class column either
+        return out, np.empty(len(out), dtype=out.dtype)
+    class_index = _class_column(class_index, out.shape[1])
+    classes = out[:, class_index]
+    if class_index == out.shape[1] - 1:
+        features = out[:, :class_index]
+    elif class_index == 0:
+        features = out[:, 1:]
+    else:
+        features = np.delete(out, class_index, axis=1)
+    return features, classes
+
+
+def _read_csv_chunks(handle, chunk_rows, dtype):
+    """Parse an open CSV file into (chunk_rows x c) arrays."""
 
-        elif self.decision_function(feature):
-            return self.left.decide(feature)
+    while True:
+        lines = list(islice(handle, chunk_rows))
+        if not lines:
+            return
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            yield np.loadtxt(lines, delimiter=',', dtype=dtype, ndmin=2)
 
+
+def iter_csv_chunks(data_file_path, class_index=-1, chunk_rows=_CSV_CHUNK_ROWS, dtype=np.float64):
+    """Stream csv data as a sequence of numpy chunks.
+    Args:
+        data_file_path (str): path to data file.
+        class_index (int): column holding the class, or None for no split.
+        chunk_rows (int): number of rows per chunk.
+        dtype: numpy type of the parsed values.
+    Yields:
+        features, classes per chunk if class_index is specified,
+            otherwise each chunk as one numpy array. The (features,
+            classes) stream can be passed to the models' fit and to
+            RandomForest.classify.
+    """
+
+    with open(data_file_path, 'r') as handle:
+        for chunk in _read_csv_chunks(handle, chunk_rows, dtype):
+            yield _split_class_column(chunk, class_index)
+
+
+def _stack_chunks(chunks):
+    """Gather a stream of (features, classes) chunks into two arrays.
+    The arrays grow geometrically, so the stream is copied about once
+    and never held as text or as a list of chunks.
+    Args:
+        chunks (iterator): (features, classes) pairs, e.g. iter_csv_chunks.
+    Returns:
+        features, classes as numpy arrays.
+    """
+
+    features = classes = None
+    size = 0
+    for chunk_features, chunk_classes in chunks:
+        if features is None:
+            features = np.empty((len(chunk_features),) + chunk_features.shape[1:],
+                                dtype=chunk_features.dtype)
+            classes = np.empty(len(chunk_classes), dtype=chunk_classes.dtype)
+        if size + len(chunk_features) > len(features):
+            capacity = max(2 * len(features), size + len(chunk_features))
+            features = np.resize(features, (capacity,) + features.shape[1:])
+            classes = np.resize(classes, capacity)
+        features[size:size + len(chunk_features)] = chunk_features
+        classes[size:size + len(chunk_classes)] = chunk_classes
+        size += len(chunk_features)
+    if features is None:
+        raise ValueError('no training data in the chunk stream')
+    return features[:size], classes[:size]
+
+
+def _training_data(features, classes):
+    """Return the training arrays of a model's fit.
+    Args:
+        features: (m x n) array, .npy path (memory-mapped), or an iterator
+            of (features, classes) chunks such as iter_csv_chunks.
+        classes (m x 1): Array of Classes; ignored for a chunk iterator.
+    Returns:
+        features, classes as numpy arrays.
+    """
+
+    if isinstance(features, Iterator):
+        return _stack_chunks(features)
+    return _as_matrix(features), np.asarray(classes)
+
+
+def _csv_cache_entry(data_file_path, class_index, dtype, cache_dir):
+    """Name the cache directory of a csv file's binary copy.
+    The name is '{stem}-{path}-{stamp}-{options}' with hashes of the
+    file's absolute path, of its modification time and size, and of the
+    load options, so editing the csv invalidates it.
+    """
+
+    stat = os.stat(data_file_path)
+    parts = ((os.path.abspath(data_file_path),), (stat.st_mtime_ns, stat.st_size),
+             (class_index, np.dtype(dtype).str))
+    hashes = [hashlib.sha1('|'.join(map(str, part)).encode()).hexdigest()[:12] for part in parts]
+    stem = os.path.splitext(os.path.basename(data_file_path))[0]
+    return os.path.join(cache_dir, '-'.join([stem] + hashes))
+
+
+def _prune_csv_cache(entry):
+    """Remove the cache entries of older versions of entry's csv file."""
+
+    cache_dir, name = os.path.split(entry)
+    source, stamp, _ = name.rsplit('-', 2)
+    for sibling in os.listdir(cache_dir):
+        parts = sibling.rsplit('-', 2)
+        if len(parts) == 3 and parts[0] == source and parts[1] != stamp:
+            # readers may still map an old entry; their open files outlive it
+            shutil.rmtree(os.path.join(cache_dir, sibling), ignore_errors=True)
+
+
+def _load_cached_csv(data_file_path, class_index, dtype, chunk_rows, cache_dir):
+    """Load csv data through a cache of binary .npy files.
+    The first load parses the csv straight into a staged data.npy memmap
+    and publishes it, dropping entries of older versions of the file;
+    later loads memory-map it read-only. A class column in the middle
+    also gets a features.npy, so the features stay a memmap.
+    """
+
+    entry = _csv_cache_entry(data_file_path, class_index, dtype, cache_dir)
+    if not os.path.isdir(entry):
+        os.makedirs(cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=cache_dir)
+        try:
+            table = load_csv(data_file_path, None, dtype, chunk_rows,
+                             mmap_path=os.path.join(staging, 'data.npy'))
+            n_columns = table.shape[1]
+            if (class_index is not None and n_columns and
+                    0 < _class_column(class_index, n_columns) < n_columns - 1):
+                features = np.lib.format.open_memmap(os.path.join(staging, 'features.npy'),
+                                                     mode='w+', dtype=dtype,
+                                                     shape=(len(table), n_columns - 1))
+                for start in range(0, len(table), chunk_rows):
+                    features[start:start + chunk_rows] = np.delete(table[start:start + chunk_rows],
+                                                                   class_index, axis=1)
+                features.flush()
+                del features
+            table.flush()
+            del table
+        except BaseException:
+            shutil.rmtree(staging)
+            raise
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # another process published the same entry first
+            shutil.rmtree(staging)
         else:
-            return self.right.decide(feature)
+            _prune_csv_cache(entry)
+    table = np.load(os.path.join(entry, 'data.npy'), mmap_mode='r')
+    features_path = os.path.join(entry, 'features.npy')
+    if class_index is not None and os.path.exists(features_path):
+        return np.load(features_path, mmap_mode='r'), table[:, class_index]
+    return _split_class_column(table, class_index)
 
 
-def load_csv(data_file_path, class_index=-1):
+def load_csv(data_file_path, class_index=-1, dtype=np.float64, chunk_rows=_CSV_CHUNK_ROWS,
+             mmap_path=None, cache_dir=None):
     """Load csv data in a numpy array.
+    The file is parsed in chunks straight into one preallocated array, so
+    memory use stays at the size of the result plus one chunk.
     Args:
         data_file_path (str): path to data file.
-        class_index (int): slice output by index.
+        class_index (int): column holding the class (negative counts from
+            the end), or None to return all columns.
+        dtype: numpy type of the result, e.g. np.float32 to halve memory.
+        chunk_rows (int): number of rows parsed at a time.
+        mmap_path (str): if given, the result is a .npy memmap at this path
+            instead of an in-memory array.
+        cache_dir (str): if given, keep a binary copy of the parsed data in
+            this directory and return read-only memmaps of it. Later loads
+            of the unchanged file skip parsing entirely.
     Returns:
         features, classes as numpy arrays if class_index is specified,
             otherwise all as nump array.
     """
 
-    handle = open(data_file_path, 'r')
-    contents = handle.read()
-    handle.close()
-    rows = contents.split('\n')
-    out = np.array([[float(i) for i in r.split(',')] for r in rows if r])
+    if cache_dir is not None:
+        return _load_cached_csv(data_file_path, class_index, dtype, chunk_rows, cache_dir)
 
-    if(class_index == -1):
-        classes= out[:,class_index]
-        features = out[:,:class_index]
-        return features, classes
-    elif(class_index == 0):
-        classes= out[:, class_index]
-        features = out[:, 1:]
-        return features, classes
+    with open(data_file_path, 'rb') as handle:
+        lines = (line for line in handle if line.strip())
+        first = next(lines, b'')
+        n_rows = sum(1 for _ in lines) + bool(first)
+    n_columns = len(first.split(b',')) if first else 0
 
+    if mmap_path is None:
+        out = np.empty((n_rows, n_columns), dtype=dtype)
     else:
-        return out
+        out = np.lib.format.open_memmap(mmap_path, mode='w+', dtype=dtype, shape=(n_rows, n_columns))
+    start = 0
+    with open(data_file_path, 'r') as handle:
+        for chunk in _read_csv_chunks(handle, chunk_rows, dtype):
+            out[start:start + len(chunk)] = chunk
+            start += len(chunk)
+
+    return _split_class_column(out, class_index)
 
 
 def build_decision_tree():
@@ -98,6 +314,44 @@ def build_decision_tree():
     return decision_tree_a4
 
 
+def multiclass_confusion_matrix(classifier_output, true_labels, classes=None):
+    """Build an n-class confusion matrix in a single bincount pass.
+    Rows are true classes and columns predicted classes, both in the order
+    of classes.
+    Args:
+        classifier_output (list(int)): output from classifier.
+        true_labels: (list(int): correct classified labels.
+        classes (list): class order; defaults to every label seen, sorted.
+    Returns:
+        Numpy array (n x n) of counts.
+    Raises:
+        ValueError: if a label is not one of classes, rather than leave
+            its example out of the counts.
+    """
+
+    output = np.asarray(classifier_output).ravel()
+    labels = np.asarray(true_labels).ravel()
+    if classes is None:
+        classes = np.union1d(output, labels)
+    classes = np.asarray(classes)
+    n = len(classes)
+    sorter = np.argsort(classes)
+    sorted_classes = classes[sorter]
+
+    def class_index(values):
+        position = np.minimum(np.searchsorted(sorted_classes, values), n - 1)
+        return sorter[position], sorted_classes[position] == values
+
+    true_index, true_known = class_index(labels)
+    output_index, output_known = class_index(output)
+    if not (true_known.all() and output_known.all()):
+        unknown = np.union1d(labels[~true_known], output[~output_known])
+        raise ValueError('labels {} are not among the classes {}'.format(unknown.tolist(),
+                                                                        classes.tolist()))
+    pairs = true_index * n + output_index
+    return np.bincount(pairs, minlength=n * n).reshape(n, n)
+
+
 def confusion_matrix(classifier_output, true_labels):
     """Create a confusion matrix to measure classifier performance.
     Output will in the format:
@@ -110,13 +364,88 @@ def confusion_matrix(classifier_output, true_labels):
         A two dimensional array representing the confusion matrix.
     """
 
-    true_positive = np.count_nonzero(np.logical_and((np.array(classifier_output) == 1), (np.array(true_labels) == 1)))
-    true_negative = np.count_nonzero(np.logical_and((np.array(classifier_output) == 0), (np.array(true_labels) == 0)))
-    false_positive = np.count_nonzero(np.logical_and((np.array(classifier_output) == 1), (np.array(true_labels) == 0)))
-    false_negative = np.count_nonzero(np.logical_and((np.array(classifier_output) == 0), (np.array(true_labels) == 1)))
+    return multiclass_confusion_matrix(classifier_output, true_labels, classes=[1, 0]).tolist()
+
+
+def _ratio(numerator, denominator):
+    """Elementwise numerator / denominator, 0 where the denominator is 0."""
+
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+
+def metrics_from_confusion(matrix, classes=None):
+    """Derive every metric from one confusion matrix.
+    Args:
+        matrix (n x n): confusion matrix, rows true and columns predicted.
+        classes (list): class of each row/column.
+    Returns:
+        Dict with the matrix, classes, accuracy, per-class precision,
+        recall and f1 arrays, and their macro averages.
+    """
+
+    matrix = np.asarray(matrix)
+    true_positive = np.diag(matrix)
+    precision_ = _ratio(true_positive, matrix.sum(axis=0))
+    recall_ = _ratio(true_positive, matrix.sum(axis=1))
+    f1 = _ratio(2 * precision_ * recall_, precision_ + recall_)
+    return {'classes': classes,
+            'confusion_matrix': matrix,
+            'accuracy': float(_ratio(true_positive.sum(), matrix.sum())),
+            'precision': precision_,
+            'recall': recall_,
+            'f1': f1,
+            'macro_precision': float(precision_.mean()) if len(matrix) else 0.0,
+            'macro_recall': float(recall_.mean()) if len(matrix) else 0.0,
+            'macro_f1': float(f1.mean()) if len(matrix) else 0.0}
+
+
+def classification_metrics(classifier_output, true_labels, classes=None):
+    """Compute accuracy, precision, recall and f1 together in one pass.
+    Args:
+        classifier_output (list(int)): output from classifier.
+        true_labels: (list(int): correct classified labels.
+        classes (list): class order; defaults to every label seen, sorted.
+    Returns:
+        Dict as returned by metrics_from_confusion.
+    """
+
+    if classes is None:
+        classes = np.union1d(np.asarray(classifier_output), np.asarray(true_labels))
+    matrix = multiclass_confusion_matrix(classifier_output, true_labels, classes)
+    return metrics_from_confusion(matrix, np.asarray(classes))
+
 
-    return [[true_positive, false_negative], [false_positive, true_negative]]
+class ConfusionAccumulator:
+    """Confusion matrix accumulated batch by batch for streaming evaluation."""
 
+    def __init__(self, classes=(0, 1)):
+        """Start an empty confusion matrix.
+        Args:
+            classes (list): class of each row/column, fixed up front. A
+                batch with any other label raises ValueError in update.
+        """
+
+        self.classes = np.asarray(classes)
+        self.matrix = np.zeros((len(self.classes), len(self.classes)), dtype=np.int64)
+
+    def update(self, classifier_output, true_labels):
+        """Add one batch of predictions.
+        Args:
+            classifier_output (list(int)): output from classifier.
+            true_labels: (list(int): correct classified labels.
+        Returns:
+            self, so updates can be chained.
+        """
+
+        self.matrix += multiclass_confusion_matrix(classifier_output, true_labels, self.classes)
+        return self
+
+    def metrics(self):
+        """Metrics of everything seen so far, see metrics_from_confusion."""
+
+        return metrics_from_confusion(self.matrix, self.classes)
 
 
 def precision(classifier_output, true_labels):
@@ -164,6 +493,52 @@ def accuracy(classifier_output, true_labels):
     return (c_matrix[0][0] + c_matrix[1][1])/np.sum(c_matrix)
 
 
+def gini_from_counts(counts):
+    """Compute gini impurity from class counts along the last axis.
+    Args:
+        counts (array (..., k)): class counts, one row per candidate.
+    Returns:
+        Array of gini impurities with the last axis reduced.
+    """
+
+    counts = np.asarray(counts, dtype=float)
+    total = counts.sum(axis=-1)
+    safe_total = np.where(total > 0, total, 1)
+    p = counts / safe_total[..., None]
+    return np.where(total > 0, 1 - np.sum(p * p, axis=-1), 0)
+
+
+def entropy_from_counts(counts):
+    """Compute entropy (in bits) from class counts along the last axis.
+    Args:
+        counts (array (..., k)): class counts, one row per candidate.
+    Returns:
+        Array of entropies with the last axis reduced.
+    """
+
+    counts = np.asarray(counts, dtype=float)
+    total = counts.sum(axis=-1)
+    safe_total = np.where(total > 0, total, 1)
+    p = counts / safe_total[..., None]
+    log_p = np.log2(p, out=np.zeros_like(p), where=p > 0)
+    return -np.sum(p * log_p, axis=-1)
+
+
+# Impurity kernels selectable as a tree's split criterion.
+CRITERIA = {'gini': gini_from_counts, 'entropy': entropy_from_counts}
+
+
+def class_counts(class_vector):
+    """Count the occurrences of every class in a label vector.
+    Args:
+        class_vector (list): Vector of class labels of any type.
+    Returns:
+        Array of counts, one per distinct class in sorted order.
+    """
+
+    return np.unique(np.asarray(class_vector), return_counts=True)[1]
+
+
 def gini_impurity(class_vector):
     """Compute the gini impurity for a list of classes.
     This is a measure of how often a randomly chosen element
@@ -173,61 +548,1152 @@ def gini_impurity(class_vector):
     It reaches its minimum at zero when all elements of class_vector
     belong to the same class.
     Args:
-        class_vector (list(int)): Vector of classes given as 0 or 1.
+        class_vector (list(int)): Vector of classes, any number of them.
     Returns:
         Floating point number representing the gini impurity.
     """
 
-    if(len(class_vector) > 0):
-        p_i = class_vector.count(1)/len(class_vector)
-    else:
-        p_i = 0
-    p_not_i = 1 - p_i
-    gini_i = 1-(p_i*p_i + p_not_i*p_not_i)
+    return float(gini_from_counts(class_counts(class_vector)))
+
+
+def entropy(class_vector):
+    """Compute the entropy (in bits) for a list of classes.
+    Args:
+        class_vector (list(int)): Vector of classes, any number of them.
+    Returns:
+        Floating point number representing the entropy.
+    """
+
+    return float(entropy_from_counts(class_counts(class_vector)))
+
+
+def _partition_gain(previous_classes, current_classes, impurity):
+    """Impurity decrease from splitting previous_classes into current_classes.
+    All partitions are counted with a single bincount over
+    (partition, class) pairs.
+    """
+
+    previous_classes = np.asarray(previous_classes)
+    labels = np.unique(previous_classes)
+    partitions = [np.asarray(each) for each in current_classes]
+    sizes = np.array([len(each) for each in partitions])
+    codes = np.searchsorted(labels, np.concatenate(partitions)) if sizes.sum() else np.zeros(0, np.intp)
+    group = np.repeat(np.arange(len(partitions)), sizes)
+    counts = np.bincount(group * len(labels) + codes, minlength=len(partitions) * len(labels))
+    counts = counts.reshape(len(partitions), len(labels))
+    previous = impurity(np.bincount(np.searchsorted(labels, previous_classes), minlength=len(labels)))
+    return float(previous - np.sum(sizes * impurity(counts)) / sizes.sum())
+
+
+def gini_gain(previous_classes, current_classes):
+    """Compute the gini impurity gain between the previous and current classes.
+    Args:
+        previous_classes (list(int)): Vector of classes, any number of them.
+        current_classes (list(list(int): A list of lists partitioning
+            previous_classes).
+    Returns:
+        Floating point number representing the information gain.
+    """
+
+    return _partition_gain(previous_classes, current_classes, gini_from_counts)
+
+
+def information_gain(previous_classes, current_classes):
+    """Compute the entropy decrease between the previous and current classes.
+    Args:
+        previous_classes (list(int)): Vector of classes, any number of them.
+        current_classes (list(list(int): A list of lists partitioning
+            previous_classes).
+    Returns:
+        Floating point number representing the information gain in bits.
+    """
+
+    return _partition_gain(previous_classes, current_classes, entropy_from_counts)
+
+
+# Most feature columns evaluated together by the split search. The block is
+# narrower still when the node's rows would exceed _SPLIT_SCRATCH elements.
+_SPLIT_BLOCK = 64
+
+# Elements of the temporaries a split search may build per block: features x
+# rows for the mean split's gathered values and masks, features x rows x
+# classes for the presorted split's class counts. Large nodes are scored fewer
+# features at a time, down to one, so peak memory stays near the input size.
+_SPLIT_SCRATCH = 1 << 16
+
+
+def split_gains(parent_counts, left_counts, criterion='gini'):
+    """Score many candidate binary splits at once from class counts.
+    left_counts typically comes from cumulative class counts over sorted
+    values, so every threshold of a feature is scored in one call.
+    Args:
+        parent_counts (array (k,)): class counts of the node being split.
+        left_counts (array (m, k)): class counts sent left by each candidate.
+        criterion (str): 'gini' or 'entropy'.
+    Returns:
+        Array (m,) of impurity decreases, one per candidate.
+    """
+
+    impurity = CRITERIA[criterion]
+    right_counts = parent_counts - left_counts
+    n = parent_counts.sum()
+    n_left = left_counts.sum(axis=1)
+    weighted = (n_left * impurity(left_counts) +
+                (n - n_left) * impurity(right_counts))
+    return impurity(parent_counts) - weighted / n
+
+
+def _weighted_one_hot(codes, weights, rows, n_classes):
+    """One row of (weighted) class indicators per example in rows.
+    Args:
+        codes (m x 1): class indices in range(n_classes).
+        weights (m x 1): sample weights, or None for unit weights.
+        rows (array(int)): indices of the examples.
+        n_classes (int): number of distinct classes.
+    Returns:
+        Array (len(rows) x n_classes).
+    """
+
+    one_hot = np.eye(n_classes)[codes[rows]]
+    if weights is not None:
+        one_hot *= weights[rows][:, None]
+    return one_hot
+
+
+def _restrict_leaf_size(gains, parent_counts, left_counts, min_samples_leaf):
+    """Disqualify candidate splits that leave a side empty or too small.
+    Args:
+        gains (array (m,)): score of each candidate.
+        parent_counts (array (k,)): class counts of the node being split.
+        left_counts (array (m, k)): class counts sent left by each candidate.
+        min_samples_leaf (float): smallest (weighted) size of a child.
+    Returns:
+        gains with disqualified candidates set to -inf.
+    """
+
+    n_left = left_counts.sum(axis=1)
+    smallest = np.minimum(n_left, parent_counts.sum() - n_left)
+    return np.where((smallest > 0) & (smallest >= min_samples_leaf), gains, -np.inf)
+
+
+def _mean_split(features, codes, weights, rows, n_classes, criterion, feature_indices,
+                sorted_rows=None, min_samples_leaf=1):
+    """Find the best mean-threshold split over every feature at once.
+    Each feature is split at its mean over ``rows`` (values >= mean go
+    left). Features are scored in blocks of at most _SPLIT_SCRATCH
+    gathered values, and the classes sent left are counted straight from
+    the boolean masks, so no candidate partition is materialized.
+    Args:
+        features (m x n): shared feature matrix.
+        codes (m x 1): class indices in range(n_classes).
+        weights (m x 1): sample weights, or None for unit weights.
+        rows (array(int)): indices of the examples at this node.
+        n_classes (int): number of distinct classes.
+        criterion (str): 'gini' or 'entropy'.
+        feature_indices (array(int)): columns that may be split on.
+        sorted_rows: unused, see _best_split.
+        min_samples_leaf (float): smallest (weighted) size of a child.
+    Returns:
+        Tuple (best feature index, threshold, impurity decrease), with an
+        impurity decrease of -inf if no candidate is allowed.
+    """
+
+    # rows grouped by class, so each class is a contiguous slice of a mask
+    rows = rows[np.argsort(codes[rows], kind='stable')]
+    node_codes = codes[rows]
+    node_weights = None if weights is None else weights[rows]
+    parent_counts = np.bincount(node_codes, node_weights, minlength=n_classes)
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(node_codes, minlength=n_classes))))
+    block_size = int(np.clip(_SPLIT_SCRATCH // max(len(rows), 1), 1, _SPLIT_BLOCK))
+    best = (0, 0.0, -np.inf)
+    for start in range(0, len(feature_indices), block_size):
+        block_indices = feature_indices[start:start + block_size]
+        # (block x rows), so every feature's values are contiguous
+        block = features.T[block_indices[:, None], rows]
+        means = np.average(block, axis=1, weights=node_weights)
+        mask = block >= means[:, None]
+        del block
+        if node_weights is None:
+            left_counts = np.stack([np.count_nonzero(mask[:, low:high], axis=1)
+                                    for low, high in zip(bounds[:-1], bounds[1:])], axis=1)
+        else:
+            left_counts = np.stack([np.bincount(node_codes[column], node_weights[column],
+                                                minlength=n_classes) for column in mask])
+        gains = split_gains(parent_counts, left_counts, criterion)
+        gains = _restrict_leaf_size(gains, parent_counts, left_counts, min_samples_leaf)
+        i = int(np.argmax(gains))
+        if gains[i] > best[2]:
+            best = (block_indices[i], means[i], gains[i])
+    return best
+
+
+def _best_split(features, codes, weights, rows, n_classes, criterion, feature_indices,
+                sorted_rows=None, min_samples_leaf=1):
+    """Find the best split over every threshold of every feature.
+    Each feature's values are sorted once and the class counts on either
+    side of every boundary between distinct values come from a cumulative
+    sum, so all thresholds of a feature are scored in O(n log n), or O(n)
+    when the rows arrive presorted. Presorted rows take a faster path that
+    scores a whole block of features with one cumulative sum.
+    Args:
+        features (m x n): shared feature matrix.
+        codes (m x 1): class indices in range(n_classes).
+        weights (m x 1): sample weights, or None for unit weights.
+        rows (array(int)): indices of the examples at this node.
+        n_classes (int): number of distinct classes.
+        criterion (str): 'gini' or 'entropy'.
+        feature_indices (array(int)): columns that may be split on.
+        sorted_rows (array(int)): optional (len(feature_indices) x len(rows))
+            array holding rows ordered by each feature in turn.
+        min_samples_leaf (float): smallest (weighted) size of a child.
+    Returns:
+        Tuple (best feature index, threshold, impurity decrease), with an
+        impurity decrease of -inf if no candidate is allowed.
+    """
+
+    parent_counts = np.bincount(codes[rows], weights=None if weights is None else weights[rows],
+                                minlength=n_classes)
+    if sorted_rows is not None:
+        return _presorted_best_split(features, codes, weights, parent_counts, criterion,
+                                     feature_indices, sorted_rows, min_samples_leaf)
+    best = (0, 0.0, -np.inf)
+    for feature in feature_indices:
+        ordered_rows = rows[np.argsort(features[rows, feature], kind='stable')]
+        sorted_values = features[ordered_rows, feature]
+        # boundary b sends sorted_values[b:] left (>= threshold)
+        boundaries = np.flatnonzero(sorted_values[1:] > sorted_values[:-1]) + 1
+        if not boundaries.size:
+            continue
+        below = np.cumsum(_weighted_one_hot(codes, weights, ordered_rows, n_classes), axis=0)
+        below = below[boundaries - 1]
+        gains = split_gains(parent_counts, parent_counts - below, criterion)
+        gains = _restrict_leaf_size(gains, parent_counts, parent_counts - below, min_samples_leaf)
+        i = int(np.argmax(gains))
+        if gains[i] > best[2]:
+            low, high = sorted_values[boundaries[i] - 1], sorted_values[boundaries[i]]
+            threshold = (low + high) / 2
+            best = (feature, threshold if threshold > low else high, gains[i])
+    return best
+
+
+def _presorted_best_split(features, codes, weights, parent_counts, criterion, feature_indices,
+                          sorted_rows, min_samples_leaf=1):
+    """_best_split over presorted rows, scoring features in column blocks.
+    Every boundary of every feature in a block is scored by one
+    split_gains call, and boundaries between equal values are masked
+    out afterwards, so the result (ties included) is the per-feature
+    scan's. Blocks hold at most _SPLIT_SCRATCH class counts, kept as
+    int32 when the weights are whole numbers; a feature with more rows
+    than that is scored in tiles.
+    Args:
+        parent_counts (array (k,)): class counts of the node.
+        sorted_rows (array(int)): (len(feature_indices) x rows) array of
+            the node's rows ordered by each feature in turn.
+        See _best_split for the others.
+    Returns:
+        Tuple (best feature index, threshold, impurity decrease).
+    """
+
+    n_classes = len(parent_counts)
+    n_rows = sorted_rows.shape[1]
+    best = (0, 0.0, -np.inf)
+    if n_rows < 2:
+        return best
+    if weights is not None and not np.issubdtype(weights.dtype, np.integer):
+        count_dtype = float
+    else:
+        count_dtype = np.int32 if parent_counts.sum() < 2**31 else np.int64
+    parent_counts = parent_counts.astype(count_dtype)
+    identity = np.eye(n_classes, dtype=count_dtype)
+    tile_rows = max(_SPLIT_SCRATCH // n_classes, 1)
+    block_size = int(np.clip(tile_rows // n_rows, 1, _SPLIT_BLOCK))
+    for start in range(0, len(feature_indices), block_size):
+        block_indices = feature_indices[start:start + block_size]
+        ordered_rows = sorted_rows[start:start + block_size]
+        # a single feature longer than tile_rows is scanned in tiles, each
+        # cumulative sum continuing from the counts below the tile
+        below = np.zeros((len(block_indices), n_classes), dtype=count_dtype)
+        for first in range(0, n_rows, tile_rows):
+            last = min(first + tile_rows, n_rows)
+            tile = ordered_rows[:, first:last]
+            # one value past the tile finds the boundary after its last position
+            sorted_values = features[ordered_rows[:, first:last + 1], block_indices[:, None]]
+            counts = identity[codes[tile]]
+            if weights is not None:
+                counts *= weights[tile][..., None]
+            counts[:, 0] += below
+            # position b of a feature sends its sorted values after b left;
+            # its last position sends nothing left and is ruled out with the ties
+            np.cumsum(counts, axis=1, out=counts)
+            below = counts[:, -1].copy()
+            left_counts = np.subtract(parent_counts, counts, out=counts).reshape(-1, n_classes)
+            gains = split_gains(parent_counts, left_counts, criterion)
+            gains = _restrict_leaf_size(gains, parent_counts, left_counts, min_samples_leaf)
+            boundary = np.zeros(tile.shape, dtype=bool)
+            np.greater(sorted_values[:, 1:], sorted_values[:, :-1],
+                       out=boundary[:, :sorted_values.shape[1] - 1])
+            gains[~boundary.ravel()] = -np.inf
+            i = int(np.argmax(gains))
+            if gains[i] > best[2]:
+                j, b = divmod(i, last - first)
+                low, high = sorted_values[j, b], sorted_values[j, b + 1]
+                threshold = (low + high) / 2
+                best = (block_indices[j], threshold if threshold > low else high, gains[i])
+    return best
+
+
+def _level_best_split(codes, weights, rows, n_classes, criterion, feature_indices, binned,
+                      levels, min_samples_leaf=1):
+    """_best_split over low-cardinality columns, from per-level histograms.
+    A node's class counts per distinct value come from one bincount per
+    feature and every boundary between the values present is scored, so
+    the result is the per-feature scan's without sorting or a presort.
+    Args:
+        feature_indices (array(int)): the columns binned encodes.
+        binned (array(int)): (len(feature_indices) x m) level codes, see
+            _discrete_columns.
+        levels (list(array)): sorted distinct values of each column.
+        See _best_split for the others.
+    Returns:
+        Tuple (best feature index, threshold, impurity decrease).
+    """
+
+    node_codes = codes[rows]
+    node_weights = None if weights is None else weights[rows]
+    parent_counts = np.bincount(node_codes, node_weights, minlength=n_classes)
+    best = (0, 0.0, -np.inf)
+    for feature, feature_bins, feature_levels in zip(feature_indices, binned, levels):
+        index = np.multiply(feature_bins[rows], n_classes, dtype=np.intp)
+        index += node_codes
+        hist = np.bincount(index, node_weights, minlength=len(feature_levels) * n_classes)
+        hist = hist.reshape(len(feature_levels), n_classes)
+        present = np.flatnonzero(hist.any(axis=1))
+        if len(present) < 2:
+            continue
+        # boundary b sends the values above present[b] left
+        left_counts = parent_counts - np.cumsum(hist[present], axis=0)[:-1]
+        gains = split_gains(parent_counts, left_counts, criterion)
+        gains = _restrict_leaf_size(gains, parent_counts, left_counts, min_samples_leaf)
+        i = int(np.argmax(gains))
+        if gains[i] > best[2]:
+            low, high = feature_levels[present[i]], feature_levels[present[i + 1]]
+            threshold = (low + high) / 2
+            best = (feature, threshold if threshold > low else high, gains[i])
+    return best
+
+
+def _quantile_bins(values, n_bins):
+    """Bin one feature's values at its n_bins quantiles.
+    Shared by the 'quantile' split strategy and the boosting binning, so
+    both place their edges the same way.
+    Args:
+        values (array): values of the feature.
+        n_bins (int): number of quantile bins.
+    Returns:
+        Tuple (edges, bins): the distinct quantiles above the smallest
+        value, ascending, and each value's bin, where bin b holds
+        edges[b - 1] <= value < edges[b].
+    """
+
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+    edges = edges[edges > values.min()]
+    return edges, np.searchsorted(edges, values, side='right')
+
+
+def _quantile_split(features, codes, weights, rows, n_classes, criterion, feature_indices,
+                    sorted_rows=None, min_samples_leaf=1, n_bins=32):
+    """Find the best split among n_bins quantile thresholds per feature.
+    An approximate _best_split: each feature's rows are histogrammed into
+    quantile bins with one bincount and only the bin edges are scored.
+    Args:
+        features (m x n): shared feature matrix.
+        codes (m x 1): class indices in range(n_classes).
+        weights (m x 1): sample weights, or None for unit weights.
+        rows (array(int)): indices of the examples at this node.
+        n_classes (int): number of distinct classes.
+        criterion (str): 'gini' or 'entropy'.
+        feature_indices (array(int)): columns that may be split on.
+        sorted_rows: unused, see _best_split.
+        min_samples_leaf (float): smallest (weighted) size of a child.
+        n_bins (int): number of quantile bins per feature.
+    Returns:
+        Tuple (best feature index, threshold, impurity decrease), with an
+        impurity decrease of -inf if no candidate is allowed.
+    """
+
+    node_codes = codes[rows]
+    node_weights = None if weights is None else weights[rows]
+    parent_counts = np.bincount(node_codes, weights=node_weights, minlength=n_classes)
+    best = (0, 0.0, -np.inf)
+    for feature in feature_indices:
+        edges, bins = _quantile_bins(features[rows, feature], n_bins)
+        if not edges.size:
+            continue
+        hist = np.bincount(bins * n_classes + node_codes, weights=node_weights,
+                           minlength=(len(edges) + 1) * n_classes)
+        hist = hist.reshape(len(edges) + 1, n_classes)
+        # edge j sends bins j + 1 and above left
+        left_counts = np.cumsum(hist[::-1], axis=0)[::-1][1:]
+        gains = split_gains(parent_counts, left_counts, criterion)
+        gains = _restrict_leaf_size(gains, parent_counts, left_counts, min_samples_leaf)
+        i = int(np.argmax(gains))
+        if gains[i] > best[2]:
+            best = (feature, edges[i], gains[i])
+    return best
+
+
+# Threshold strategies selectable for tree building.
+_SPLITTERS = {'mean': _mean_split, 'best': _best_split, 'quantile': _quantile_split}
+
+# Columns with at most this many distinct values, such as integer codes or
+# flags, are split by the 'best' strategy from per-level class histograms
+# instead of a presort.
+_MAX_LEVELS = 256
+
+
+def _index_dtype(n):
+    """Smallest index type for arrays of n examples: int32 when it fits."""
+
+    return np.int32 if n < 2**31 else np.intp
+
+
+def _discrete_columns(features, feature_indices):
+    """Find and encode the low-cardinality columns among feature_indices.
+    Args:
+        features (m x n): m examples with n features.
+        feature_indices (array(int)): columns to look at.
+    Returns:
+        Tuple (boolean mask over feature_indices of the d columns with at
+        most _MAX_LEVELS distinct values, (d x m) uint8 level codes, list
+        of the d columns' sorted distinct values).
+    """
+
+    mask = np.zeros(len(feature_indices), dtype=bool)
+    binned, levels = [], []
+    for j, feature in enumerate(feature_indices):
+        values = features[:, feature]
+        # a prefix already rules out most continuous columns
+        if len(np.unique(values[:4 * _MAX_LEVELS])) > _MAX_LEVELS:
+            continue
+        column_levels, codes = np.unique(values, return_inverse=True)
+        if len(column_levels) > _MAX_LEVELS:
+            continue
+        mask[j] = True
+        binned.append(codes.astype(np.uint8))
+        levels.append(column_levels)
+    binned = np.array(binned) if binned else np.empty((0, len(features)), dtype=np.uint8)
+    return mask, binned, levels
+
+
+def _as_matrix(features):
+    """Return features as an array without copying.
+    Args:
+        features: array-like, or path to a .npy file which is then
+            memory-mapped read-only.
+    Returns:
+        Numpy array (or read-only memmap) of features.
+    """
+
+    if isinstance(features, (str, os.PathLike)):
+        return np.load(features, mmap_mode='r')
+    return np.asarray(features)
+
+
+class Profiler:
+    """Opt-in recorder of where fitting and classifying spend their time.
+    While a Profiler is active (``with Profiler() as profiler:``) the tree
+    builders and models record timed spans: builds, per-node split
+    searches (rows, candidate features scanned) and partitions (rows,
+    bytes of temporaries), per-tree fits and predictions and vote
+    aggregation. Spans nest per thread. Work done in worker processes
+    (n_jobs > 1 forest fits, cross-validation, grid search) is not seen.
+    Profiling costs nothing when no Profiler is active.
+    """
+
+    def __init__(self, trace_memory=False):
+        """Create an inactive profiler.
+        Args:
+            trace_memory (bool): also record allocated_bytes (net change)
+                and peak_bytes of every span with tracemalloc. Slows numpy
+                allocations down, and spans of concurrent threads share
+                the process-wide counters.
+        """
+
+        self.trace_memory = trace_memory
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._previous = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        global _PROFILER
+        self._previous, _PROFILER = _PROFILER, self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        global _PROFILER
+        _PROFILER = self._previous
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block of work.
+        Args:
+            name (str): kind of work, e.g. 'split.search'.
+            attributes: numbers describing the work, e.g. rows=...
+        Yields:
+            The attributes dict, which the block may add to.
+        """
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = {'path': (stack[-1]['path'] if stack else ()) + (name,), 'children': 0.0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['before'] = frame['peak'] = current
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            record = {'name': name, 'path': ';'.join(frame['path']), 'start': start - self._origin,
+                      'duration': duration, 'self_duration': duration - frame['children'],
+                      'thread': threading.get_ident()}
+            record.update(attributes)
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame['peak'])
+                record['allocated_bytes'] = current - frame['before']
+                record['peak_bytes'] = peak - frame['before']
+            if stack:
+                stack[-1]['children'] += duration
+                if self.trace_memory:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            with self._lock:
+                self.spans.append(record)
+
+    def summary(self):
+        """Aggregate the spans by name.
+        Returns:
+            Dict of name to count, total and self seconds, and the sum of
+            every additive attribute (rows, features, bytes, ...).
+        """
+
+        totals = {}
+        for record in self.spans:
+            total = totals.setdefault(record['name'], {'count': 0})
+            total['count'] += 1
+            for key, value in record.items():
+                if key in ('start', 'thread', 'node', 'depth', 'round'):
+                    continue
+                if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                    total[key] = total.get(key, 0) + value
+        return totals
+
+    def to_json(self, path=None):
+        """Export every span and the summary as JSON.
+        Args:
+            path (str): file to write; by default only return the text.
+        Returns:
+            The JSON text.
+        """
+
+        text = json.dumps({'spans': self.spans, 'summary': self.summary()}, default=float)
+        if path is not None:
+            with open(path, 'w') as handle:
+                handle.write(text)
+        return text
+
+    def to_trace(self, path):
+        """Write a Chrome trace event file (chrome://tracing, Perfetto, speedscope).
+        Args:
+            path (str): file to write.
+        """
+
+        events = [{'name': record['name'], 'ph': 'X', 'pid': os.getpid(), 'tid': record['thread'],
+                   'ts': record['start'] * 1e6, 'dur': record['duration'] * 1e6,
+                   'args': {key: value for key, value in record.items()
+                            if key not in ('name', 'start', 'duration', 'thread')}}
+                  for record in self.spans]
+        with open(path, 'w') as handle:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, handle, default=float)
+
+    def to_collapsed(self, path):
+        """Write collapsed stacks ("a;b;c microseconds") for flamegraph.pl.
+        Each line holds a span path and the time spent in it outside of its
+        child spans, summed over all spans with that path.
+        Args:
+            path (str): file to write.
+        """
+
+        self_times = {}
+        for record in self.spans:
+            self_times[record['path']] = self_times.get(record['path'], 0) + record['self_duration']
+        with open(path, 'w') as handle:
+            for stack, seconds in sorted(self_times.items()):
+                handle.write('{} {}\n'.format(stack, int(round(seconds * 1e6))))
+
+
+# The Profiler currently recording, if any.
+_PROFILER = None
+
+
+def _span(name, **attributes):
+    """Return a span of the active Profiler, or a no-op context.
+    Either way the context yields the attributes dict.
+    """
+
+    if _PROFILER is None:
+        return nullcontext(attributes)
+    return _PROFILER.span(name, **attributes)
+
+
+# Nodes with at least this many examples have their features searched in
+# parallel groups when a tree is built with n_jobs > 1.
+_PARALLEL_MIN_ROWS = 4096
+
+
+class _ThresholdDecision:
+    """Picklable decision function: features[feature] >= threshold."""
+
+    def __init__(self, feature, threshold):
+        self.feature = feature
+        self.threshold = threshold
+
+    def __call__(self, features):
+        return features[self.feature] >= self.threshold
+
+
+class _FlatTree:
+    """Fitted decision tree compiled into parallel node arrays.
+    Node i is a leaf when left[i] == -1. Otherwise examples with
+    features[feature[i]] >= threshold[i] go to node left[i] and the rest
+    to node right[i]. value[i] holds the class index of the node's label,
+    which classes maps back to the original class values.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, classes):
+        """Wrap the node arrays of a fitted tree.
+        Args:
+            feature (array(int)): split feature per node.
+            threshold (array(float)): split threshold per node.
+            left (array(int)): left child per node, -1 for leaves.
+            right (array(int)): right child per node, -1 for leaves.
+            value (array(float)): class index per node.
+            classes (array): class values indexed by value.
+        """
+
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=float)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=float)
+        self.classes = classes
+
+    def apply(self, features):
+        """Route every example to its leaf, one tree level at a time.
+        Args:
+            features (m x n): m examples with n features.
+        Returns:
+            Array (m,) of leaf node indices.
+        """
+
+        features = np.asarray(features)
+        node = np.zeros(len(features), dtype=np.intp)
+        active = np.arange(len(features)) if self.left[0] >= 0 else node[:0]
+        while active.size:
+            current = node[active]
+            go_left = features[active, self.feature[current]] >= self.threshold[current]
+            node[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[self.left[node[active]] >= 0]
+        return node
+
+    def predict(self, features):
+        """Classify a batch of examples.
+        Args:
+            features (m x n): m examples with n features.
+        Returns:
+            Array (m,) of class labels.
+        """
+
+        return self.classes[self.value[self.apply(features)].astype(np.intp)]
+
+    def truncate(self, depth_limit):
+        """Cut the tree back to a smaller depth limit.
+        Growth below a node never depends on the depth limit, so this equals
+        the tree fitted with depth_limit (every internal node already holds
+        its majority value).
+        Args:
+            depth_limit (float): The maximum depth to keep.
+        Returns:
+            _FlatTree with the nodes down to depth_limit.
+        """
+
+        if depth_limit == float('inf'):
+            return self
+        depth = np.full(len(self.left), -1)
+        level, d = np.zeros(1, dtype=np.intp), 0
+        while level.size and d <= depth_limit:
+            depth[level] = d
+            inner = level[self.left[level] >= 0]
+            level = np.concatenate((self.left[inner], self.right[inner]))
+            d += 1
+        kept = np.flatnonzero(depth >= 0)
+        leaf = (self.left[kept] < 0) | (depth[kept] >= depth_limit)
+        index = np.full(len(self.left), -1, dtype=np.intp)
+        index[kept] = np.arange(len(kept))
+        return _FlatTree(np.where(leaf, 0, self.feature[kept]),
+                         np.where(leaf, 0.0, self.threshold[kept]),
+                         np.where(leaf, -1, index[self.left[kept]]),
+                         np.where(leaf, -1, index[self.right[kept]]),
+                         self.value[kept], self.classes)
+
+    def to_node(self):
+        """Rebuild the linked DecisionNode representation of the tree.
+        Returns:
+            Root DecisionNode.
+        """
+
+        nodes = []
+        for i in range(len(self.left)):
+            if self.left[i] < 0:
+                label = self.classes[int(self.value[i])] if self.value[i] >= 0 else None
+                nodes.append(DecisionNode(None, None, None, label))
+            else:
+                decision = _ThresholdDecision(int(self.feature[i]), float(self.threshold[i]))
+                nodes.append(DecisionNode(None, None, decision))
+        for i, node in enumerate(nodes):
+            if self.left[i] >= 0:
+                node.left = nodes[self.left[i]]
+                node.right = nodes[self.right[i]]
+        return nodes[0]
+
+
+class _ClassStatistics:
+    """Node statistics of classification trees: (weighted) class counts.
+    A node's value is the class index of its majority label, and its
+    splits are found by one of _SPLITTERS, scored by impurity decrease.
+    """
+
+    def __init__(self, classes, weights=None, criterion='gini', threshold='best', n_bins=32,
+                 min_samples_leaf=1):
+        """Encode the classes once.
+        Args:
+            classes (m x 1): Array of Classes.
+            weights (m x 1): sample weights, or None for unit weights.
+            criterion (str): split criterion, a key of CRITERIA.
+            threshold (str): threshold strategy, a key of _SPLITTERS.
+            n_bins (int): bins per feature for the 'quantile' strategy.
+            min_samples_leaf (float): smallest (weighted) size of a child.
+        """
+
+        classes = np.asarray(classes)
+        # searchsorted needs far less scratch than return_inverse
+        self.classes = np.unique(classes)
+        self.codes = np.searchsorted(self.classes, classes)
+        self.weights = weights
+        self.criterion = criterion
+        self.min_samples_leaf = min_samples_leaf
+        self.splitter = _SPLITTERS[threshold]
+        if threshold == 'quantile':
+            self.splitter = partial(self.splitter, n_bins=n_bins)
+
+    def node(self, rows):
+        """Summarize the examples of a node.
+        Args:
+            rows (array(int)): indices of the examples at this node.
+        Returns:
+            Tuple (leaf value, (weighted) size, whether a split may help),
+            where a node of a single class is not worth splitting.
+        """
+
+        counts = np.bincount(self.codes[rows], None if self.weights is None else self.weights[rows],
+                             minlength=len(self.classes))
+        present = np.count_nonzero(counts)
+        return (np.argmax(counts) if present else -1), counts.sum(), present > 1
+
+    def split(self, features, rows, feature_indices, sorted_rows=None):
+        """Find the best split of a node over some features.
+        Args:
+            features (m x n): shared feature matrix.
+            rows (array(int)): indices of the examples at this node.
+            feature_indices (array(int)): columns that may be split on.
+            sorted_rows (array(int)): optional presorted rows, see _best_split.
+        Returns:
+            Tuple (feature, threshold, gain), with a gain of -inf if no
+            candidate is allowed.
+        """
+
+        return self.splitter(features, self.codes, self.weights, rows, len(self.classes),
+                             self.criterion, feature_indices, sorted_rows, self.min_samples_leaf)
+
+    def split_levels(self, rows, feature_indices, binned, levels):
+        """Find the best split of a node over low-cardinality features.
+        Args:
+            rows (array(int)): indices of the examples at this node.
+            feature_indices (array(int)): the columns binned encodes.
+            binned (array(int)): level codes, see _discrete_columns.
+            levels (list(array)): sorted distinct values of each column.
+        Returns:
+            Tuple (feature, threshold, gain), see _level_best_split.
+        """
+
+        return _level_best_split(self.codes, self.weights, rows, len(self.classes), self.criterion,
+                                 feature_indices, binned, levels, self.min_samples_leaf)
+
+
+class _TreeBuilder:
+    """Grow a decision tree over a single shared copy of the data.
+    The feature matrix and class vector are stored once. Every node is a
+    range of one index array, which is partitioned in place when the node
+    splits, so fitting never duplicates the dataset. With presorted rows
+    the per-feature orderings are partitioned the same way (stably), so
+    the 'best' strategy never sorts below the root. Nodes are emitted
+    straight into flat arrays (see _FlatTree).
+    Growth is iterative: nodes waiting to be split sit on an explicit
+    stack (depth-first), or, with a leaf budget, on a priority queue that
+    always splits the pending node of highest gain next (best-first).
+    With n_jobs > 1, split searches run on a thread pool: large nodes
+    have their features scored in parallel groups, and depth-first
+    growth expands several independent pending nodes per step. The
+    result does not depend on n_jobs.
+    Low-cardinality columns may be split from per-level histograms
+    instead (see _discrete_columns); they then need no presort at all.
+    What a node holds and how its splits are scored comes from a node
+    statistics object: class counts (_ClassStatistics) by default, or
+    gradient and hessian sums (_GradientStatistics) for boosting.
+    """
+
+    def __init__(self, features, classes, depth_limit, criterion='gini', threshold='best',
+                 n_bins=32, sample_weight=None, feature_indices=None, presorted=None,
+                 max_leaf_nodes=None, min_samples_split=2, min_samples_leaf=1, n_jobs=1,
+                 copy_presorted=True, statistics=None, discrete=None):
+        """Prepare the shared data for building.
+        Args:
+            features (m x n): m examples with n features, or a .npy path.
+            classes (m x 1): Array of Classes; unused with statistics.
+            depth_limit (float): The maximum depth to build the tree.
+            criterion (str): split criterion, a key of CRITERIA.
+            threshold (str): threshold strategy, a key of _SPLITTERS.
+            n_bins (int): bins per feature for the 'quantile' strategy.
+            sample_weight (m x 1): weight of each example, e.g. its bootstrap
+                multiplicity. Examples of weight 0 are left out entirely.
+            feature_indices (array(int)): columns that may be split on.
+                Defaults to every column.
+            presorted (array(int)): optional (len(feature_indices) x m)
+                array of all examples ordered by each feature, used by the
+                'best' strategy.
+            max_leaf_nodes (int): leaf budget; grows best-first when set.
+            min_samples_split (float): smallest (weighted) node size to split.
+            min_samples_leaf (float): smallest (weighted) size of a child.
+            n_jobs (int): threads used to search for splits, -1 for all cores.
+            copy_presorted (bool): False when presorted belongs to this
+                builder alone and may be partitioned in place; by default
+                a shared presort is copied first.
+            statistics: node statistics in place of the class counts of
+                classes, e.g. _GradientStatistics. criterion, threshold,
+                n_bins and min_samples_leaf then belong to it.
+            discrete (tuple): low-cardinality columns from _discrete_columns,
+                split from histograms by the 'best' strategy; presorted
+                then holds the other columns only.
+        """
+
+        self.features = _as_matrix(features)
+        self.weights = None
+        index_dtype = _index_dtype(len(self.features))
+        self.samples = np.arange(len(self.features), dtype=index_dtype)
+        if sample_weight is not None:
+            # whole-number weights such as bootstrap draws stay integers
+            self.weights = np.asarray(sample_weight)
+            if not np.issubdtype(self.weights.dtype, np.integer):
+                self.weights = self.weights.astype(float)
+            self.samples = np.flatnonzero(self.weights > 0).astype(index_dtype)
+        # reused by every partition instead of fresh temporaries
+        self._scratch = np.empty(len(self.samples), dtype=index_dtype)
+        self._mask = np.empty(len(self.samples), dtype=bool)
+        if feature_indices is None:
+            feature_indices = np.arange(self.features.shape[1])
+        self.feature_indices = np.asarray(feature_indices, dtype=np.intp)
+        self.sorted = None
+        if presorted is not None and threshold == 'best':
+            # keep the weighted examples of every ordering; the result is
+            # this tree's own workspace, partitioned in place as it grows
+            if self.weights is None:
+                self.sorted = np.array(presorted, dtype=index_dtype, copy=copy_presorted or None)
+            else:
+                keep = self.weights > 0
+                self.sorted = np.empty((len(presorted), len(self.samples)), dtype=index_dtype)
+                for ordering, kept in zip(presorted, self.sorted):
+                    np.compress(keep[ordering], ordering, out=kept)
+            self._goes_left = np.zeros(len(self.features), dtype=bool)
+        self.discrete = None
+        if threshold == 'best' and discrete is not None and discrete[0].any():
+            self.discrete = discrete
+        if self.discrete is not None:
+            # presort row of each continuous position, see _search_mixed
+            self._continuous_before = np.concatenate(([0], np.cumsum(~discrete[0])))
+        self.depth_limit = depth_limit
+        self.max_leaf_nodes = max_leaf_nodes
+        self.min_samples_split = min_samples_split
+        self.n_jobs = n_jobs
+        if statistics is None:
+            statistics = _ClassStatistics(classes, self.weights, criterion, threshold, n_bins,
+                                          min_samples_leaf)
+        self.statistics = statistics
+
+    def build(self, depth=0):
+        """Build the whole tree.
+        Args:
+            depth (int): depth of the root node.
+        Returns:
+            Fitted _FlatTree.
+        """
 
-    return gini_i
+        self.nodes = ([], [], [], [], [])
+        best_first = self.max_leaf_nodes is not None
+        self._workers = _n_workers(self.n_jobs)
+        with _span('tree.build', rows=len(self.samples), features=len(self.feature_indices)), \
+                ThreadPoolExecutor(self._workers) if self._workers > 1 else nullcontext() as pool:
+            self._pool = pool
+            pending = [split for _, split in self._evaluate([(0, len(self.samples), depth)])
+                       if split is not None]
+            n_leaves = 1
+            while pending and (not best_first or n_leaves < self.max_leaf_nodes):
+                if best_first:
+                    batch = [heapq.heappop(pending)]
+                else:
+                    batch = [pending.pop() for _ in range(min(self._workers, len(pending)))]
+                parents, ranges = [], []
+                for split in batch:
+                    children = self._partition(*split)
+                    if children is not None:
+                        parents.append(split[1])
+                        ranges.extend(children)
+                n_leaves += len(parents)
+                evaluated = self._evaluate(ranges)
+                for parent, left, right in zip(parents, evaluated[::2], evaluated[1::2]):
+                    self.nodes[2][parent] = left[0]
+                    self.nodes[3][parent] = right[0]
+                # push right before left so depth-first growth finishes left first
+                for _, split in reversed(evaluated):
+                    if split is None:
+                        continue
+                    if best_first:
+                        heapq.heappush(pending, split)
+                    else:
+                        pending.append(split)
+        self._pool = None
+        feature, threshold, left, right, value = self.nodes
+        return _FlatTree(feature, threshold, left, right, value, self.statistics.classes)
+
+    def _add_node(self, value):
+        """Append a leaf node and return its index."""
+
+        for column, item in zip(self.nodes, (0, 0.0, -1, -1, value)):
+            column.append(item)
+        return len(self.nodes[0]) - 1
+
+    def _evaluate(self, ranges):
+        """Add leaf nodes for ranges of samples and find their splits.
+        Args:
+            ranges (list): (start, end, depth) of each node, where the
+                node's examples are samples[start:end].
+        Returns:
+            List of (node index, pending split or None if the node stays a
+            leaf) per range. A pending split is (-gain, node, start, end,
+            depth, feature, threshold), ordered for the best-first queue.
+        """
 
+        results, searches = [], []
+        for start, end, depth in ranges:
+            value, size, mixed = self.statistics.node(self.samples[start:end])
+            node = self._add_node(value)
+            results.append((node, None))
+            if mixed and depth < self.depth_limit and size >= self.min_samples_split:
+                searches.append((len(results) - 1, start, end, depth))
+
+        # large nodes score their features in one group per worker
+        tasks = []
+        for i, start, end, depth in searches:
+            n_groups = self._workers if end - start >= _PARALLEL_MIN_ROWS else 1
+            bounds = np.linspace(0, len(self.feature_indices), n_groups + 1).astype(int)
+            tasks.extend((i, results[i][0], depth, start, end, slice(low, high))
+                         for low, high in zip(bounds[:-1], bounds[1:]))
+        found = self._pool.map(self._search, tasks) if self._pool is not None else map(self._search, tasks)
+        best = {}
+        for (i, _, _, _, _, _), candidate in zip(tasks, found):
+            # groups arrive in feature order, so ties keep the first feature
+            if i not in best or candidate[2] > best[i][2]:
+                best[i] = candidate
+
+        for i, start, end, depth in searches:
+            feature, threshold, gain = best[i]
+            if gain > -np.inf:
+                node = results[i][0]
+                results[i] = (node, (-gain, node, start, end, depth, feature, threshold))
+        return results
+
+    def _search(self, task):
+        """Find the best split of one node over one group of features.
+        Args:
+            task (tuple): (result index, node, depth, start, end, slice of
+                the node's positions in feature_indices).
+        Returns:
+            Tuple (feature, threshold, gain) from the node statistics.
+        """
+
+        _, node, depth, start, end, group = task
+        feature_indices = self.feature_indices[group]
+        with _span('split.search', node=node, depth=depth, rows=end - start,
+                   features=len(feature_indices)):
+            if self.discrete is not None:
+                return self._search_mixed(start, end, group)
+            sorted_rows = None if self.sorted is None else self.sorted[group, start:end]
+            return self.statistics.split(self.features, self.samples[start:end], feature_indices,
+                                         sorted_rows)
+
+    def _search_mixed(self, start, end, group):
+        """_search over presorted and low-cardinality features together."""
+
+        rows = self.samples[start:end]
+        mask, binned, levels = self.discrete
+        low, high = group.start, group.stop
+        feature_indices = self.feature_indices[low:high]
+        # both kinds keep feature order, so each group is a slice of its rows
+        continuous_low, continuous_high = self._continuous_before[[low, high]]
+        discrete_low, discrete_high = low - continuous_low, high - continuous_high
+        candidates = [(0, 0.0, -np.inf)]
+        if continuous_high > continuous_low:
+            candidates.append(self.statistics.split(
+                self.features, rows, feature_indices[~mask[low:high]],
+                self.sorted[continuous_low:continuous_high, start:end]))
+        if discrete_high > discrete_low:
+            candidates.append(self.statistics.split_levels(
+                rows, feature_indices[mask[low:high]], binned[discrete_low:discrete_high],
+                levels[discrete_low:discrete_high]))
+        # equal gains go to the feature listed first, as in a single scan
+        position = {feature: i for i, feature in enumerate(feature_indices)}
+        return max(candidates, key=lambda found: (found[2], -position.get(found[0], 0)))
+
+    def _partition(self, _, node, start, end, depth, feature, threshold):
+        """Split a pending node by partitioning its range in place.
+        Returns:
+            The (start, end, depth) ranges of the left and right children,
+            or None if the node could not be split after all.
+        """
+
+        with _span('split.partition', node=node, depth=depth, rows=end - start) as info:
+            return self._partition_range(node, start, end, depth, feature, threshold, info)
+
+    def _partition_range(self, node, start, end, depth, feature, threshold, info):
+        """_partition; info receives the bytes of temporaries allocated."""
+
+        rows = self.samples[start:end]
+        go_left = self.features[rows, feature] >= threshold
+        n_left = np.count_nonzero(go_left)
+        # np.compress gathers through an index array of the kept rows
+        info['bytes'] = go_left.nbytes + len(rows) * np.dtype(np.intp).itemsize
+        if n_left == 0 or n_left == len(rows):
+            # no feature separates the rows: the node stays a leaf
+            return None
+        scratch, goes_left = self._scratch[:len(rows)], self._mask[:len(rows)]
+        if self.sorted is not None:
+            # a stable partition keeps every feature's ordering sorted; one
+            # ordering at a time goes through the scratch buffers
+            self._goes_left[rows] = go_left
+            for ordering in self.sorted[:, start:end]:
+                np.take(self._goes_left, ordering, out=goes_left)
+                np.compress(goes_left, ordering, out=scratch[:n_left])
+                np.compress(np.logical_not(goes_left, out=goes_left), ordering,
+                            out=scratch[n_left:])
+                ordering[...] = scratch
+        # left rows first, then right
+        np.compress(go_left, rows, out=scratch[:n_left])
+        np.compress(np.logical_not(go_left, out=go_left), rows, out=scratch[n_left:])
+        rows[...] = scratch
+        self.nodes[0][node] = feature
+        self.nodes[1][node] = threshold
+        return (start, start + n_left, depth + 1), (start + n_left, end, depth + 1)
 
-def gini_gain(previous_classes, current_classes):
-    """Compute the gini impurity gain between the previous and current classes.
-    Args:
-        previous_classes (list(int)): Vector of classes given as 0 or 1.
-        current_classes (list(list(int): A list of lists where each list has
-            0 and 1 values).
-    Returns:
-        Floating point number representing the information gain.
-    """
-    
-    previous_entropy = gini_impurity(previous_classes)
-    sum = 0
-    length = 0
-    for each in current_classes:
-        sum += gini_impurity(each)*len(each)
-        length += len(each)
-    gini_g = previous_entropy - sum/length
-    return gini_g
 
 class DecisionTree:
     """Class for automatic tree-building and classification."""
 
-    def __init__(self, depth_limit=float('inf')):
+    def __init__(self, depth_limit=float('inf'), criterion='gini', threshold='best', n_bins=32,
+                 max_leaf_nodes=None, min_samples_split=2, min_samples_leaf=1, n_jobs=1):
         """Create a decision tree with a set depth limit.
         Starts with an empty root.
         Args:
             depth_limit (float): The maximum depth to build the tree.
+            criterion (str): split criterion, 'gini' or 'entropy'.
+            threshold (str): 'best' scans every threshold of every feature,
+                'quantile' only n_bins quantiles per feature, and 'mean'
+                only the feature mean.
+            n_bins (int): bins per feature for the 'quantile' strategy.
+            max_leaf_nodes (int): leaf budget. When set the tree grows
+                best-first, always splitting the node of highest gain next.
+            min_samples_split (float): smallest (weighted) node size to split.
+            min_samples_leaf (float): smallest (weighted) size of a child.
+            n_jobs (int): threads used to search for splits, -1 for all cores.
+                Feature groups of large nodes and independent subtrees are
+                searched concurrently; the fitted tree is the same.
         """
 
+        self.tree_ = None
         self.root = None
         self.depth_limit = depth_limit
-
-    def fit(self, features, classes):
-        """Build the tree from root using __build_tree__().
+        self.criterion = criterion
+        self.threshold = threshold
+        self.n_bins = n_bins
+        self.max_leaf_nodes = max_leaf_nodes
+        self.min_samples_split = min_samples_split
+        self.min_samples_leaf = min_samples_leaf
+        self.n_jobs = n_jobs
+
+    @property
+    def root(self):
+        """Root DecisionNode, rebuilt from the flat arrays on first use."""
+
+        if self._root is None and self.tree_ is not None:
+            self._root = self.tree_.to_node()
+        return self._root
+
+    @root.setter
+    def root(self, node):
+        self._root = node
+
+    def fit(self, features, classes=None, sample_weight=None, feature_indices=None):
+        """Build the tree from root and compile it into flat arrays.
         Args:
-            features (m x n): m examples with n features.
-            classes (m x 1): Array of Classes.
+            features (m x n): m examples with n features, the path of a
+                .npy file to memory-map read-only instead of loading, or an
+                iterator of (features, classes) chunks (see iter_csv_chunks).
+            classes (m x 1): Array of Classes, unless features is a chunk
+                iterator.
+            sample_weight (m x 1): optional weight per example, such as a
+                bootstrap multiplicity; examples of weight 0 are ignored.
+            feature_indices (list(int)): optional subset of columns to split
+                on. Splits still refer to columns of the full matrix.
         """
 
-        self.root = self.__build_tree__(features, classes)
+        features, classes = _training_data(features, classes)
+        with _span('tree.fit'):
+            self.tree_ = self._builder(features, classes, sample_weight=sample_weight,
+                                       feature_indices=feature_indices).build()
+        self.root = None
 
     def __build_tree__(self, features, classes, depth=0):
         """Build tree that automatically finds the decision functions.
@@ -238,49 +1704,31 @@ class DecisionTree:
         Returns:
             Root node of decision tree.
         """
-        # base cases are correct
-        value, counts = np.unique(classes, return_counts=True)
-        d = dict(zip(value, counts))
-        if len(d) == 0:
-            return DecisionNode(None, None, None, None)
-        if len(d) == 1:
-            x = list(d.keys())[0]
-            return DecisionNode(None, None, None, x)
-        elif depth == self.depth_limit:
-            return DecisionNode(None, None, None, max(d.keys()))
-        # mean of each is th
-        # get split
-        shape = np.shape(features)
-        means = features.mean(axis=0)
-        gini_gains = []
-        split = []
-        f_1 = []
-        f_2 = []
-        # don't convert between np array and list
-        for i in range(shape[1]):
-            split1 = []
-            split2 = []
-            features1 = []
-            features2 = []
-            for j in range(shape[0]):
-                if features[j][i] >= means[i]:
-                    split1.append(classes[j])
-                    features1.append(list(features[j,:]))
-                else:
-                    split2.append(classes[j])
-                    features2.append(list(features[j,:]))
-            split.append(split1)
-            split.append(split2)
-            f_1.append(features1)
-            f_2.append(features2)
-            gini_gains.append(gini_gain(list(classes), [split1, split2]))
-        alpha_best_idx = gini_gains.index(max(gini_gains))
-        # create decision node that splits on alpha best
-        # recursion on left and right to build tree
-        node = DecisionNode(None, None, lambda features: features[alpha_best_idx] >= means[alpha_best_idx])
-        node.left = self.__build_tree__(np.array(f_1[alpha_best_idx]), np.array(split[2*alpha_best_idx]), depth+1)
-        node.right = self.__build_tree__(np.array(f_2[alpha_best_idx]), np.array(split[2*alpha_best_idx+1]), depth+1)
-        return node
+
+        return self._builder(features, classes).build(depth=depth).to_node()
+
+    def _builder(self, features, classes, **options):
+        """Create a _TreeBuilder configured by this tree's settings.
+        The 'best' strategy splits low-cardinality features (integer codes,
+        flags) from per-level histograms and gets every other feature
+        presorted once, so no node below the root sorts.
+        """
+
+        features = _as_matrix(features)
+        if self.threshold == 'best' and options.get('presorted') is None:
+            feature_indices = options.get('feature_indices')
+            if feature_indices is None:
+                feature_indices = np.arange(features.shape[1])
+            feature_indices = np.asarray(feature_indices, dtype=np.intp)
+            options['feature_indices'] = feature_indices
+            options['discrete'] = _discrete_columns(features, feature_indices)
+            options['presorted'] = _presort(features, feature_indices[~options['discrete'][0]])
+            options['copy_presorted'] = False
+        return _TreeBuilder(features, classes, self.depth_limit, self.criterion, self.threshold,
+                            self.n_bins, max_leaf_nodes=self.max_leaf_nodes,
+                            min_samples_split=self.min_samples_split,
+                            min_samples_leaf=self.min_samples_leaf, n_jobs=self.n_jobs,
+                            **options)
 
 
     def classify(self, features):
@@ -291,6 +1739,10 @@ class DecisionTree:
             A list of class labels.
         """
 
+        if self.tree_ is not None:
+            # route the whole batch through the flat arrays at once
+            with _span('tree.classify', rows=len(features)):
+                return self.tree_.predict(features).tolist()
         class_labels = []
         # feed features into decision tree and get class_labels
         for each in features:
@@ -298,6 +1750,37 @@ class DecisionTree:
         return class_labels
 
 
+def k_fold_indices(classes, k, stratify=False, random_state=None):
+    """Partition example indices into k folds without touching the data.
+    Args:
+        classes (m x 1): Array of Classes (only its length is used unless
+            stratify is set).
+        k (int): number of folds.
+        stratify (bool): keep each class's share about equal in every fold.
+        random_state (int): seed; by default one is drawn from np.random.
+    Returns:
+        List of k (train_indices, test_indices) tuples. The test indices of
+        the folds are disjoint and together cover every example.
+    """
+
+    classes = np.asarray(classes)
+    if random_state is None:
+        random_state = np.random.randint(0, 2**31 - 1)
+    rng = np.random.default_rng(random_state)
+    fold_of = np.empty(len(classes), dtype=np.intp)
+    if stratify:
+        # deal each class's shuffled examples round-robin over the folds,
+        # starting each class where the previous one stopped
+        dealt = 0
+        for label in np.unique(classes):
+            members = rng.permutation(np.flatnonzero(classes == label))
+            fold_of[members] = (dealt + np.arange(len(members))) % k
+            dealt += len(members)
+    else:
+        fold_of[rng.permutation(len(classes))] = np.arange(len(classes)) % k
+    return [(np.flatnonzero(fold_of != i), np.flatnonzero(fold_of == i)) for i in range(k)]
+
+
 def generate_k_folds(dataset, k):
     """Split dataset into folds.
     Randomly split data into k equal subsets.
@@ -311,198 +1794,975 @@ def generate_k_folds(dataset, k):
         => Each fold is a tuple of sets.
         => Each Set is a tuple of numpy arrays.
     """
-    data = np.hstack((dataset[0], (dataset[1]).reshape((len(dataset[1]), 1))))
-    
-    length = len(dataset[1])
-    num = int(length/k)
+
+    features, classes = np.asarray(dataset[0]), np.asarray(dataset[1])
     folds = []
-    for i in range(k):
-        d = data
-        np.random.shuffle(d)
-        test = d[:num]
-        train = d[num:]
-        test_0 = test[:,0:3]
-        test_1 = test[:, 4]
-        test_1.reshape((num,))
-        train_0 = train[:,0:3]
-        train_1 = train[:, 4]
-        train_1.reshape((length-num,))
-        tr = (train_0, train_1)
-        te = (test_0, test_1)
+    for train, test in k_fold_indices(classes, k):
+        tr = (features[train], classes[train])
+        te = (features[test], classes[test])
         folds.append((tr, te))
 
     return folds
 
 
+def _n_workers(n_jobs):
+    """Resolve an n_jobs setting (-1 means all cores) to a worker count."""
+
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def _bounded_map(pool, function, items, window):
+    """Map function over items, on pool if given, yielding results in order.
+    At most window results are in flight at once, so large per-item
+    outputs never pile up in memory.
+    Args:
+        pool (Executor): pool to run on, or None to run inline.
+        function (func): function of one item.
+        items (iterable): items to map over.
+        window (int): maximum number of submitted, unconsumed items.
+    Yields:
+        function(item) for each item, in order.
+    """
+
+    if pool is None:
+        for item in items:
+            yield function(item)
+        return
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class _SharedArray:
+    """Numpy array copied once into shared memory.
+    Worker processes attach to it by name (see _attach_shared) instead of
+    receiving a pickled copy of the data with every task.
+    """
+
+    def __init__(self, array):
+        """Copy array into a new shared memory block.
+        Args:
+            array: array to share.
+        """
+
+        array = np.ascontiguousarray(array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.spec = (self.shm.name, array.shape, array.dtype.str)
+        np.ndarray(array.shape, array.dtype, buffer=self.shm.buf)[...] = array
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Shared memory blocks and arrays attached by the current worker process.
+_WORKER_SHM = []
+_WORKER_ARRAYS = ()
+
+
+def _attach_shared(*specs):
+    """Process pool initializer: attach the arrays described by specs."""
+
+    global _WORKER_ARRAYS, _PROFILER
+    # a forked worker inherits the parent's profiler, whose spans would be lost
+    _PROFILER = None
+    arrays = []
+    for name, shape, dtype in specs:
+        shm = shared_memory.SharedMemory(name=name)
+        _WORKER_SHM.append(shm)
+        arrays.append(np.ndarray(shape, np.dtype(dtype), buffer=shm.buf))
+    _WORKER_ARRAYS = tuple(arrays)
+
+
+def _presort(features, feature_indices=None):
+    """Order every feature column once for the whole forest.
+    Args:
+        features (m x n): m examples with n features.
+        feature_indices (array(int)): only sort these columns.
+    Returns:
+        Array (n x m) whose row j lists the examples sorted by feature j
+        (by feature feature_indices[j] when given), as int32 when m fits.
+    """
+
+    if feature_indices is None:
+        feature_indices = np.arange(features.shape[1])
+    presorted = np.empty((len(feature_indices), len(features)), dtype=_index_dtype(len(features)))
+    # one column at a time, so only one int64 argsort result exists at once
+    for ordering, feature in zip(presorted, feature_indices):
+        ordering[...] = np.argsort(features[:, feature], kind='stable')
+    return presorted
+
+
+def _fit_bootstrap_tree(features, classes, presorted, seed, depth_limit, example_subsample_rate,
+                        attr_subsample_rate, rows=None):
+    """Fit one forest tree on a bootstrap sample drawn from its own seed.
+    The bootstrap sample is expressed as per-row draw counts used as sample
+    weights, so the tree trains on the shared matrix without copying it,
+    and its per-feature orderings are filtered from the forest-wide
+    presort, so it never sorts.
+    Args:
+        features (m x n): m examples with n features.
+        classes (m x 1): Array of Classes.
+        presorted (n x m): per-feature orderings, see _presort.
+        seed (SeedSequence): seed of this tree's random generator.
+        depth_limit (int): max depth limit of tree.
+        example_subsample_rate (float): percentage of example samples.
+        attr_subsample_rate (float): percentage of attribute samples.
+        rows (array(int)): rows the sample is drawn from, by default all.
+    Returns:
+        Tuple (fitted _FlatTree, the attribute indices it may split on,
+        the out-of-bag rows: those of rows it never drew).
+    """
+
+    rng = np.random.default_rng(seed)
+    m, n = features.shape
+    rows = np.arange(m) if rows is None else np.asarray(rows)
+    data_indices = rows[rng.choice(len(rows), int(example_subsample_rate*len(rows)), replace=True)]
+    attribute_indices = np.sort(rng.choice(n, max(1, int(attr_subsample_rate*n)), replace=False))
+    draws = np.bincount(data_indices, minlength=m)
+    with _span('forest.tree', rows=len(data_indices), features=len(attribute_indices)):
+        flat_tree = _TreeBuilder(features, classes, depth_limit, sample_weight=draws,
+                                 feature_indices=attribute_indices,
+                                 presorted=presorted[attribute_indices]).build()
+    return flat_tree, attribute_indices, rows[draws[rows] == 0]
+
+
+def _fit_shared_bootstrap_tree(seed, depth_limit, example_subsample_rate, attr_subsample_rate,
+                               rows=None):
+    """_fit_bootstrap_tree on the arrays attached by _attach_shared."""
+
+    features, classes, presorted = _WORKER_ARRAYS
+    return _fit_bootstrap_tree(features, classes, presorted, seed, depth_limit,
+                               example_subsample_rate, attr_subsample_rate, rows)
+
+
+def _majority_vote(counts, classes):
+    """Pick the class with most votes per row; ties go to the larger label.
+    Args:
+        counts (m x k): votes per class.
+        classes (array): sorted class values of the k columns.
+    Returns:
+        Array (m,) of labels.
+    """
+
+    last_best = np.argmax(counts[:, ::-1], axis=1)
+    return classes[len(classes) - 1 - last_best]
+
+
 class RandomForest:
     """Random forest classification."""
 
     def __init__(self, num_trees=5, depth_limit=5, example_subsample_rate=0.5,
-                 attr_subsample_rate=0.5):
+                 attr_subsample_rate=0.5, n_jobs=1, random_state=None, oob_score=False):
         """Create a random forest.
          Args:
              num_trees (int): fixed number of trees.
              depth_limit (int): max depth limit of tree.
              example_subsample_rate (float): percentage of example samples.
              attr_subsample_rate (float): percentage of attribute samples.
+             n_jobs (int): worker processes used to fit trees and threads used
+                 to classify, -1 for all cores.
+             random_state (int): seed for the bootstrap samples. By default
+                 one is drawn from np.random, so np.random.seed still applies.
+             oob_score (bool): estimate accuracy on out-of-bag examples
+                 while fitting (see fit).
         """
 
         self.trees = []
+        self.classes_ = None
+        self.feature_indices_ = []
+        self.oob_score_ = None
+        self.oob_decision_ = None
         self.num_trees = num_trees
         self.depth_limit = depth_limit
         self.example_subsample_rate = example_subsample_rate
         self.attr_subsample_rate = attr_subsample_rate
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.oob_score = oob_score
 
-    def fit(self, features, classes):
+    def fit(self, features, classes=None):
         """Build a random forest of decision trees using Bootstrap Aggregation.
-            features (m x n): m examples with n features.
-            classes (m x 1): Array of Classes.
+            features (m x n): m examples with n features, or an iterator of
+                (features, classes) chunks (see iter_csv_chunks).
+            classes (m x 1): Array of Classes, unless features is a chunk
+                iterator.
+        Each tree draws its sample from its own child SeedSequence, so the
+        forest is the same whatever the number of workers. Every feature is
+        sorted once up front and all trees derive their orderings from that.
+        With n_jobs > 1 the data and the presort are placed in shared memory
+        once and trees are fitted on a process pool.
+        The attribute indices each tree was allowed to split on are kept in
+        feature_indices_. With oob_score, every example is classified by
+        the trees whose bootstrap sample left it out: oob_decision_ holds
+        those vote shares (NaN for examples every tree drew) and
+        oob_score_ their accuracy, with no separate validation pass.
         """
 
-        data_shuffle = np.hstack((features, classes.reshape(len(classes), 1)))
-        # np.random.shuffle(data_shuffle)
-        for i in range(15):
-            train = []
-            data_indices = np.random.choice(range(0, len(features)), int(self.example_subsample_rate*len(features)), replace=True)
-            attribute_indices = np.sort(np.random.choice(range(0, len(features[0])), int(0.75*len(features[0])), replace=False))
-            for each in data_indices:
-                x = []
-                for a in attribute_indices:
-                    x.append(data_shuffle[each][a])
-                x.append(data_shuffle[each][len(data_shuffle[0])-1])
-                train.append(x)
+        if self.num_trees < 1:
+            raise ValueError('num_trees must be at least 1, got {}'.format(self.num_trees))
+        for name in ('example_subsample_rate', 'attr_subsample_rate'):
+            if not 0 < getattr(self, name) <= 1:
+                raise ValueError('{} must be in (0, 1], got {}'.format(name, getattr(self, name)))
+        features, classes = _training_data(features, classes)
+        self.classes_ = np.unique(classes)
+        random_state = self.random_state
+        if random_state is None:
+            random_state = np.random.randint(0, 2**31 - 1)
+        seeds = np.random.SeedSequence(random_state).spawn(self.num_trees)
+        options = dict(depth_limit=self.depth_limit,
+                       example_subsample_rate=self.example_subsample_rate,
+                       attr_subsample_rate=self.attr_subsample_rate)
+        workers = min(_n_workers(self.n_jobs), len(seeds))
+        with _span('forest.presort', rows=len(features), features=features.shape[1]):
+            presorted = _presort(features)
+        if workers == 1:
+            fitted = [_fit_bootstrap_tree(features, classes, presorted, seed, **options)
+                      for seed in seeds]
+        else:
+            with _SharedArray(features) as shared_features, _SharedArray(classes) as shared_classes, \
+                    _SharedArray(presorted) as shared_presorted:
+                specs = (shared_features.spec, shared_classes.spec, shared_presorted.spec)
+                with ProcessPoolExecutor(workers, initializer=_attach_shared, initargs=specs) as pool:
+                    fitted = list(pool.map(partial(_fit_shared_bootstrap_tree, **options), seeds))
+        self.trees, self.feature_indices_ = [], []
+        counts = np.zeros((len(features), len(self.classes_))) if self.oob_score else None
+        for flat_tree, attribute_indices, oob_rows in fitted:
             tree = DecisionTree(self.depth_limit)
-            t = np.array(train)
-            tree.fit(t[:, :-1], t[:, -1])
+            tree.tree_ = flat_tree
             self.trees.append(tree)
+            self.feature_indices_.append(attribute_indices)
+            if counts is not None:
+                votes = np.searchsorted(self.classes_, flat_tree.predict(features[oob_rows]))
+                counts[oob_rows, votes] += 1
+        if counts is not None:
+            total = counts.sum(axis=1, keepdims=True)
+            with np.errstate(invalid='ignore'):
+                self.oob_decision_ = counts / total
+            scored = total[:, 0] > 0
+            output = _majority_vote(counts[scored], self.classes_)
+            self.oob_score_ = float(np.mean(output == classes[scored])) if scored.any() else None
+
+    def _vote_counts(self, features, tree_weights=None, pool=None):
+        """Tally the (weighted) votes of every tree.
+        Votes are added into the (m x k) totals one tree at a time, so the
+        full (trees x m) prediction matrix is never held in memory.
+        Args:
+            features (m x n): m examples with n features.
+            tree_weights (array): optional vote weight per tree.
+            pool (Executor): optional pool that evaluates trees concurrently.
+        Returns:
+            Array (m x k) of votes per class in self.classes_.
+        """
 
-    def classify(self, features):
-        """Classify a list of features based on the trained random forest.
+        features = _as_matrix(features)
+        n_classes = len(self.classes_)
+        # offset each sample's class index so every sample owns k bins
+        offsets = n_classes * np.arange(len(features))
+        counts = np.zeros(n_classes * len(features))
+
+        def tree_votes(tree):
+            with _span('forest.tree_predict', rows=len(features)):
+                return np.searchsorted(self.classes_, tree.tree_.predict(features)) + offsets
+
+        window = 2 * _n_workers(self.n_jobs)
+        for i, votes in enumerate(_bounded_map(pool, tree_votes, self.trees, window)):
+            weight = 1 if tree_weights is None else tree_weights[i]
+            with _span('forest.vote_add', rows=len(features), bytes=counts.nbytes):
+                counts += weight * np.bincount(votes, minlength=len(counts))
+        return counts.reshape(len(features), n_classes)
+
+    def predict_proba(self, features, tree_weights=None):
+        """Estimate class probabilities as the share of (weighted) votes.
         Args:
             features (m x n): m examples with n features.
+            tree_weights (array): optional vote weight per tree.
+        Returns:
+            Array (m x k) of probabilities for the classes in self.classes_.
         """
-        labels = []
-        counts = []
-        max_votes = []
-        for tree in self.trees:
-            labels.append(list(tree.classify(features)))
-        l = np.array([np.array(label) for label in labels])
-        s = l.shape
-        # print(len(l))
-        for i in range(s[1]):
-            classification, count = np.unique(l[:,i], return_counts=True)
-            d = dict(zip(classification, count))
-            counts.append(d)
-        # print(len(counts))
-        for each in counts:
-            if 0 in each.keys() and 1 in each.keys():
-                if each[0] > each[1]:
-                    max_votes.append(0)
-                else:
-                    max_votes.append(1)
-            elif 0 in each.keys() and 1 not in each.keys():
-                max_votes.append(0)
-            else:
-                max_votes.append(1)
-        mv = np.array(max_votes)
-        # print(len(max_votes))
-        return mv
 
+        with self._predict_pool() as pool:
+            counts = self._vote_counts(features, tree_weights, pool)
+        return counts / counts.sum(axis=1, keepdims=True)
+
+    def classify(self, features, tree_weights=None):
+        """Classify a list of features based on the trained random forest.
+        Args:
+            features (m x n): m examples with n features, or an iterator
+                of such chunks (e.g. slices of a memory-mapped file).
+            tree_weights (array): optional vote weight per tree.
+        Returns:
+            Array of majority-vote labels; ties go to the larger label.
+            For an iterator of chunks, a generator of one array per chunk.
+        """
 
-class ChallengeClassifier:
-    """Challenge Classifier used on Challenge Training Data."""
+        if isinstance(features, Iterator):
+            return self.classify_chunks(features, tree_weights)
+        with self._predict_pool() as pool:
+            return self._majority(self._vote_counts(features, tree_weights, pool))
 
-    def __init__(self, depth_limit=10):
-        """Create a decision tree with a set depth limit.
-        Starts with an empty root.
+    def classify_chunks(self, chunks, tree_weights=None):
+        """Classify a stream of feature chunks, yielding labels chunk by chunk.
+        Only one chunk and its (rows x classes) vote totals are held in
+        memory at a time. Trees are evaluated on a thread pool of n_jobs
+        threads, which share the fitted trees without copying them.
         Args:
-            depth_limit (float): The maximum depth to build the tree.
+            chunks (iterable): feature arrays (rows x n), or (features,
+                classes) pairs as iter_csv_chunks yields, whose classes are
+                ignored.
+            tree_weights (array): optional vote weight per tree.
+        Yields:
+            Array of majority-vote labels for each chunk.
         """
 
-        self.root = None
+        with self._predict_pool() as pool:
+            for chunk in chunks:
+                if isinstance(chunk, tuple):
+                    chunk = chunk[0]
+                yield self._majority(self._vote_counts(chunk, tree_weights, pool))
+
+    def _predict_pool(self):
+        """Return a thread pool for n_jobs > 1, else a no-op context."""
+
+        workers = min(_n_workers(self.n_jobs), len(self.trees))
+        if workers == 1:
+            return nullcontext()
+        return ThreadPoolExecutor(workers)
+
+    def _majority(self, counts):
+        """Pick the label with most votes; ties go to the larger label."""
+
+        return _majority_vote(counts, self.classes_)
+
+
+def _bin_features(features, n_bins):
+    """Map every feature to at most n_bins quantile bins, once.
+    Args:
+        features (m x n): m examples with n features.
+        n_bins (int): bins per feature.
+    Returns:
+        Tuple (binned (m x n) bin codes, edges (n x n_bins - 1)), where bin
+        b of feature j holds edges[j, b - 1] <= value < edges[j, b].
+        Unused edges are inf.
+    """
+
+    edges = np.full((features.shape[1], n_bins - 1), np.inf)
+    binned = np.empty(features.shape, dtype=np.min_scalar_type(n_bins - 1))
+    for j in range(features.shape[1]):
+        feature_edges, binned[:, j] = _quantile_bins(features[:, j], n_bins)
+        edges[j, :len(feature_edges)] = feature_edges
+    return binned, edges
+
+
+class _GradientStatistics:
+    """Node statistics of boosted regression trees: gradient and hessian sums.
+    A node's value is its shrunken Newton step -learning_rate * G / (H +
+    l2_regularization). Splits are searched on binned features: a node
+    histograms the gradients and hessians of its examples over every
+    (feature, bin) pair with one bincount, then scores all bin edges at
+    once. Thresholds are the raw edge values, so _TreeBuilder partitions
+    and _FlatTree predicts on the raw features.
+    """
+
+    classes = None
+
+    def __init__(self, binned, edges, gradients, hessians, learning_rate=0.1,
+                 l2_regularization=1.0, min_samples_leaf=1):
+        """Prepare one boosting round.
+        Args:
+            binned (m x n): bin codes, see _bin_features.
+            edges (n x n_bins - 1): bin edges, see _bin_features.
+            gradients (m x 1): loss gradient per example.
+            hessians (m x 1): loss hessian per example.
+            learning_rate (float): shrinkage of the leaf values.
+            l2_regularization (float): added to the hessian sums.
+            min_samples_leaf (int): smallest number of examples in a child.
+        """
+
+        self.binned = binned
+        self.edges = edges
+        self.gradients = gradients
+        self.hessians = hessians
+        self.learning_rate = learning_rate
+        self.l2_regularization = l2_regularization
+        self.min_samples_leaf = min_samples_leaf
+        self.n_bins = edges.shape[1] + 1
+
+    def node(self, rows):
+        """Summarize the examples of a node.
+        Returns:
+            Tuple (Newton step, number of examples, True).
+        """
+
+        step = -self.learning_rate * (self.gradients[rows].sum() /
+                                      (self.hessians[rows].sum() + self.l2_regularization))
+        return step, len(rows), True
+
+    def split(self, features, rows, feature_indices, sorted_rows=None):
+        """Find the bin edge with the largest loss reduction.
+        Args:
+            features: unused, the search runs on the binned features.
+            rows (array(int)): indices of the examples at this node.
+            feature_indices (array(int)): columns that may be split on.
+            sorted_rows: unused.
+        Returns:
+            Tuple (feature, threshold, gain): values >= threshold go left.
+            The gain is -inf if no split reduces the loss.
+        """
+
+        n_features = len(feature_indices)
+        # each feature owns n_bins consecutive histogram slots
+        offsets = self.n_bins * np.arange(n_features)
+        index = (self.binned[rows[:, None], feature_indices] + offsets).ravel()
+        size = n_features * self.n_bins
+        hists = [np.bincount(index, weights, size).reshape(n_features, self.n_bins)
+                 for weights in (np.repeat(self.gradients[rows], n_features),
+                                 np.repeat(self.hessians[rows], n_features), None)]
+        # edge b sends bins b + 1 and above left
+        grad_left, hess_left, count_left = [np.cumsum(hist[:, ::-1], axis=1)[:, ::-1][:, 1:]
+                                            for hist in hists]
+        grad, hess = self.gradients[rows].sum(), self.hessians[rows].sum()
+        lam = self.l2_regularization
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gains = (grad_left ** 2 / (hess_left + lam) +
+                     (grad - grad_left) ** 2 / (hess - hess_left + lam) - grad ** 2 / (hess + lam))
+        allowed = (count_left >= self.min_samples_leaf) & \
+                  (len(rows) - count_left >= self.min_samples_leaf)
+        gains = np.where(allowed, gains, -np.inf)
+        best = int(np.argmax(gains))
+        if not gains.flat[best] > 0:
+            return 0, 0.0, -np.inf
+        j, edge = divmod(best, self.n_bins - 1)
+        feature = feature_indices[j]
+        return feature, self.edges[feature, edge], gains.flat[best]
+
+
+class GradientBoosting:
+    """Gradient-boosted regression trees for classification.
+    Two classes are fitted with the logistic loss and one tree per round,
+    more classes with the softmax loss and one tree per class per round.
+    """
+
+    def __init__(self, num_trees=50, depth_limit=3, learning_rate=0.1, n_bins=32,
+                 l2_regularization=1.0, min_samples_leaf=20, n_iter_no_change=None,
+                 validation_fraction=0.1, random_state=None, max_leaf_nodes=None,
+                 min_samples_split=2, n_jobs=1):
+        """Create a boosted ensemble.
+        Args:
+            num_trees (int): maximum number of boosting rounds.
+            depth_limit (int): max depth limit of each tree.
+            learning_rate (float): shrinkage of every tree's contribution.
+            n_bins (int): quantile bins per feature (at most 65536).
+            l2_regularization (float): penalty on the leaf values.
+            min_samples_leaf (int): smallest number of examples in a leaf.
+            n_iter_no_change (int): stop once the validation loss has not
+                improved for this many rounds; None trains every round.
+            validation_fraction (float): share of the examples held out for
+                early stopping when fit gets no eval_set.
+            random_state (int): seed of the held-out split.
+            max_leaf_nodes (int): leaf budget per tree; trees grow
+                best-first, by loss reduction, when set.
+            min_samples_split (int): smallest node size to split.
+            n_jobs (int): threads used to search for splits, -1 for all cores.
+        """
+
+        self.trees = []
+        self.classes_ = None
+        self.baseline_ = None
+        self.validation_loss_ = []
+        self.num_trees = num_trees
         self.depth_limit = depth_limit
+        self.learning_rate = learning_rate
+        self.n_bins = n_bins
+        self.l2_regularization = l2_regularization
+        self.min_samples_leaf = min_samples_leaf
+        self.n_iter_no_change = n_iter_no_change
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+        self.max_leaf_nodes = max_leaf_nodes
+        self.min_samples_split = min_samples_split
+        self.n_jobs = n_jobs
+
+    def fit(self, features, classes=None, eval_set=None):
+        """Boost trees on the loss gradients of the current scores.
+        Features are binned once up front; each round's trees threshold the
+        raw feature values, so prediction needs no binning. With
+        n_iter_no_change, only the rounds up to the best validation loss
+        are kept.
+        Args:
+            features (m x n): m examples with n features, or an iterator of
+                (features, classes) chunks (see iter_csv_chunks).
+            classes (m x 1): Array of Classes, unless features is a chunk
+                iterator.
+            eval_set (tuple): optional (features, classes) for early
+                stopping instead of holding out validation_fraction.
+        """
 
-    def fit(self, features, classes):
-        """Build the tree from root using __build_tree__().
+        features, classes = _training_data(features, classes)
+        if self.n_iter_no_change is not None and eval_set is None:
+            if self.random_state is None:
+                seed = np.random.randint(0, 2**31 - 1)
+            else:
+                seed = self.random_state
+            order = np.random.default_rng(seed).permutation(len(classes))
+            held_out = order[:int(self.validation_fraction * len(classes))]
+            kept = np.sort(order[len(held_out):])
+            eval_set = (features[held_out], classes[held_out])
+            features, classes = features[kept], classes[kept]
+        self.classes_, codes = np.unique(classes, return_inverse=True)
+        targets = np.eye(len(self.classes_))[codes]
+        if len(self.classes_) == 2:
+            targets = targets[:, 1:]
+        prior = targets.mean(axis=0).clip(1e-12, 1 - 1e-12)
+        self.baseline_ = np.log(prior / (1 - prior)) if len(self.classes_) == 2 else np.log(prior)
+
+        binned, edges = _bin_features(features, self.n_bins)
+        scores = np.tile(self.baseline_, (len(classes), 1))
+        if eval_set is not None:
+            eval_features = _as_matrix(eval_set[0])
+            eval_codes = np.searchsorted(self.classes_, np.asarray(eval_set[1]))
+            eval_scores = np.tile(self.baseline_, (len(eval_codes), 1))
+        self.trees, self.validation_loss_ = [], []
+        best_round = 0
+        for round_index in range(self.num_trees):
+            proba = self._proba(scores)
+            residuals = proba - targets if targets.shape[1] > 1 else proba[:, 1:] - targets
+            hessians = proba * (1 - proba) if targets.shape[1] > 1 else proba[:, 1:] * proba[:, :1]
+            round_trees = []
+            for k in range(targets.shape[1]):
+                statistics = _GradientStatistics(binned, edges, residuals[:, k], hessians[:, k],
+                                                 self.learning_rate, self.l2_regularization,
+                                                 self.min_samples_leaf)
+                builder = _TreeBuilder(features, None, self.depth_limit,
+                                       max_leaf_nodes=self.max_leaf_nodes,
+                                       min_samples_split=self.min_samples_split,
+                                       n_jobs=self.n_jobs, statistics=statistics)
+                with _span('boost.tree', round=round_index, rows=len(scores)):
+                    round_trees.append(builder.build())
+                    scores[:, k] += round_trees[-1].value[round_trees[-1].apply(features)]
+            self.trees.append(round_trees)
+            if eval_set is None:
+                continue
+            for k, tree in enumerate(round_trees):
+                eval_scores[:, k] += tree.value[tree.apply(eval_features)]
+            eval_proba = self._proba(eval_scores)[np.arange(len(eval_codes)), eval_codes]
+            self.validation_loss_.append(float(-np.mean(np.log(eval_proba.clip(1e-15)))))
+            if self.validation_loss_[-1] < self.validation_loss_[best_round]:
+                best_round = round_index
+            elif self.n_iter_no_change is not None and \
+                    round_index - best_round >= self.n_iter_no_change:
+                break
+        if self.n_iter_no_change is not None:
+            self.trees = self.trees[:best_round + 1]
+
+    def _proba(self, scores):
+        """Turn raw scores (m x 1 for two classes, else m x k) into probabilities."""
+
+        if scores.shape[1] == 1:
+            positive = 1 / (1 + np.exp(-scores))
+            return np.hstack((1 - positive, positive))
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def decision_function(self, features):
+        """Sum the baseline and every tree's leaf value.
         Args:
             features (m x n): m examples with n features.
-            classes (m x 1): Array of Classes.
+        Returns:
+            Array of raw scores, (m x 1) for two classes, else (m x k).
         """
 
-        self.root = self.__build_tree__(features, classes)
+        features = _as_matrix(features)
+        scores = np.tile(self.baseline_, (len(features), 1))
+        for round_trees in self.trees:
+            for k, tree in enumerate(round_trees):
+                scores[:, k] += tree.value[tree.apply(features)]
+        return scores
 
-    def __build_tree__(self, features, classes, depth=0):
-        """Build tree that automatically finds the decision functions.
+    def predict_proba(self, features):
+        """Estimate class probabilities.
         Args:
             features (m x n): m examples with n features.
-            classes (m x 1): Array of Classes.
-            depth (int): depth to build tree to.
         Returns:
-            Root node of decision tree.
+            Array (m x k) of probabilities for the classes in self.classes_.
         """
-        # base cases are correct
-        value, counts = np.unique(classes, return_counts=True)
-        d = dict(zip(value, counts))
-        if len(d) == 0:
-            return DecisionNode(None, None, None, None)
-        if len(d) == 1:
-            x = list(d.keys())[0]
-            return DecisionNode(None, None, None, x)
-        elif depth == self.depth_limit:
-            return DecisionNode(None, None, None, max(d.keys()))
-        # mean of each is th
-        # get split
-        shape = np.shape(features)
-        means = features.mean(axis=0)
-        gini_gains = []
-        split = []
-        f_1 = []
-        f_2 = []
-        # don't convert between np array and list
-        for i in range(shape[1]):
-            split1 = []
-            split2 = []
-            features1 = []
-            features2 = []
-            for j in range(shape[0]):
-                if features[j][i] >= means[i]:
-                    split1.append(classes[j])
-                    features1.append(list(features[j,:]))
-                else:
-                    split2.append(classes[j])
-                    features2.append(list(features[j,:]))
-            split.append(split1)
-            split.append(split2)
-            f_1.append(features1)
-            f_2.append(features2)
-            gini_gains.append(gini_gain(list(classes), [split1, split2]))
-        alpha_best_idx = gini_gains.index(max(gini_gains))
-        # create decision node that splits on alpha best
-        # recursion on left and right to build tree
-        node = DecisionNode(None, None, lambda features: features[alpha_best_idx] >= means[alpha_best_idx])
-        node.left = self.__build_tree__(np.array(f_1[alpha_best_idx]), np.array(split[2*alpha_best_idx]), depth+1)
-        node.right = self.__build_tree__(np.array(f_2[alpha_best_idx]), np.array(split[2*alpha_best_idx+1]), depth+1)
-        return node
 
+        return self._proba(self.decision_function(features))
 
     def classify(self, features):
-        """Use the fitted tree to classify a list of example features.
+        """Classify a batch of examples.
         Args:
             features (m x n): m examples with n features.
-        Return:
-            A list of class labels.
+        Returns:
+            Array of the most probable labels; ties go to the larger label.
         """
 
-        class_labels = []
-        # feed features into decision tree and get class_labels
-        for each in features:
-            class_labels.append(self.root.decide(each))
-        return class_labels
-        
+        return _majority_vote(self.predict_proba(features), self.classes_)
+
+
+class ChallengeClassifier(DecisionTree):
+    """Challenge Classifier used on Challenge Training Data.
+    A DecisionTree with the challenge settings; it shares the tree engine,
+    including the fast paths of the 'best' strategy: per-level histograms
+    for the low-cardinality (integer, flag) columns and a presort for the
+    continuous ones.
+    """
+
+    def __init__(self, depth_limit=10, criterion='gini', threshold='best', n_bins=32,
+                 max_leaf_nodes=None, min_samples_split=2, min_samples_leaf=1, n_jobs=1):
+        """Create a decision tree with a set depth limit.
+        Starts with an empty root.
+        Args:
+            depth_limit (float): The maximum depth to build the tree.
+            See DecisionTree for the others.
+        """
+
+        super().__init__(depth_limit, criterion, threshold, n_bins, max_leaf_nodes,
+                         min_samples_split, min_samples_leaf, n_jobs)
+
+
+def _evaluate_fold(features, classes, model_factory, train, test, labels):
+    """Fit a fresh model on one fold's training rows and score its test rows.
+    Models whose fit accepts sample_weight train on the full matrix with
+    the test rows weighted 0, so no training copy is made.
+    Returns:
+        Dict of the fold's metrics plus fit_time and predict_time.
+    """
+
+    model = model_factory()
+    start = time.perf_counter()
+    if 'sample_weight' in inspect.signature(model.fit).parameters:
+        weights = np.zeros(len(classes))
+        weights[train] = 1
+        model.fit(features, classes, sample_weight=weights)
+    else:
+        model.fit(features[train], classes[train])
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    output = model.classify(features[test])
+    predict_time = time.perf_counter() - start
+    result = classification_metrics(output, classes[test], labels)
+    result.update(fit_time=fit_time, predict_time=predict_time, test_size=len(test))
+    return result
+
+
+def _evaluate_shared_fold(model_factory, train, test, labels):
+    """_evaluate_fold on the arrays attached by _attach_shared."""
+
+    features, classes = _WORKER_ARRAYS
+    return _evaluate_fold(features, classes, model_factory, train, test, labels)
+
+
+# Scalar per-fold results summarized by cross_validate.
+_FOLD_SUMMARY = ('accuracy', 'macro_precision', 'macro_recall', 'macro_f1', 'fit_time',
+                 'predict_time')
+
+
+def cross_validate(model_factory, features, classes, k=10, stratify=False, n_jobs=1,
+                   random_state=None):
+    """Estimate a model's performance with k-fold cross-validation.
+    Folds are index sets built once by k_fold_indices. With n_jobs > 1
+    the data is placed in shared memory once and folds are fitted and
+    scored in parallel on a process pool.
+    Args:
+        model_factory (func): picklable callable returning an unfitted
+            model, e.g. partial(RandomForest, num_trees=10).
+        features (m x n): m examples with n features.
+        classes (m x 1): Array of Classes.
+        k (int): number of folds.
+        stratify (bool): keep class shares equal across folds.
+        n_jobs (int): worker processes, -1 for all cores.
+        random_state (int): seed of the fold assignment.
+    Returns:
+        Dict with 'folds' (per-fold metrics and timings, see
+        classification_metrics) and the 'mean' and 'std' over folds of
+        accuracy, macro precision/recall/f1, fit_time and predict_time.
+    """
+
+    features = _as_matrix(features)
+    classes = np.asarray(classes)
+    labels = np.unique(classes)
+    folds = k_fold_indices(classes, k, stratify, random_state)
+    workers = min(_n_workers(n_jobs), k)
+    if workers == 1:
+        results = [_evaluate_fold(features, classes, model_factory, train, test, labels)
+                   for train, test in folds]
+    else:
+        with _SharedArray(features) as shared_features, _SharedArray(classes) as shared_classes:
+            specs = (shared_features.spec, shared_classes.spec)
+            with ProcessPoolExecutor(workers, initializer=_attach_shared, initargs=specs) as pool:
+                trains, tests = zip(*folds)
+                results = list(pool.map(partial(_evaluate_shared_fold, model_factory, labels=labels),
+                                        trains, tests))
+    return {'folds': results,
+            'mean': {name: float(np.mean([fold[name] for fold in results])) for name in _FOLD_SUMMARY},
+            'std': {name: float(np.std([fold[name] for fold in results])) for name in _FOLD_SUMMARY}}
+
+
+# RandomForest parameters that grid_search_forest can vary.
+_GRID_PARAMS = ('num_trees', 'depth_limit', 'example_subsample_rate', 'attr_subsample_rate')
+
+
+def grid_search_forest(features, classes, param_grid, k=5, scoring='accuracy', stratify=False,
+                       n_jobs=1, random_state=None, refit=True):
+    """Pick RandomForest parameters by k-fold cross-validation over a grid.
+    Trees are only fitted once per sampling rate combination, fold and
+    tree index, at the largest depth limit: a forest of n trees is the
+    first n trees of a larger one (trees draw from spawned seeds), and a
+    tree fitted to a smaller depth limit is the deep tree truncated (see
+    _FlatTree.truncate). The grid thus costs about as much as its largest
+    forest per fold. With n_jobs > 1 the data and the presort go to
+    shared memory once and tree fits run on a process pool.
+    Args:
+        features (m x n): m examples with n features.
+        classes (m x 1): Array of Classes.
+        param_grid (dict): list of values per name in _GRID_PARAMS; other
+            parameters keep the RandomForest defaults.
+        k (int): number of folds.
+        scoring (str): metric to maximize, 'accuracy', 'macro_precision',
+            'macro_recall' or 'macro_f1'.
+        stratify (bool): keep class shares equal across folds.
+        n_jobs (int): worker processes, -1 for all cores.
+        random_state (int): seed of the folds and of every forest. By
+            default one is drawn from np.random.
+        refit (bool): also build the best forest on all examples.
+    Returns:
+        Dict with 'results' (params, per-fold scores and their mean and
+        std for every grid point), 'best_params', 'best_score' and, with
+        refit, 'best_estimator': the RandomForest that
+        RandomForest(**best_params, random_state=random_state).fit would
+        build.
+    """
+
+    unknown = set(param_grid) - set(_GRID_PARAMS)
+    if unknown:
+        raise ValueError('cannot search over {}'.format(', '.join(sorted(unknown))))
+    defaults = inspect.signature(RandomForest.__init__).parameters
+    grid = {name: sorted(param_grid.get(name, [defaults[name].default])) for name in _GRID_PARAMS}
+    features = _as_matrix(features)
+    classes = np.asarray(classes)
+    labels = np.unique(classes)
+    if random_state is None:
+        random_state = np.random.randint(0, 2**31 - 1)
+    folds = k_fold_indices(classes, k, stratify, random_state)
+    # the refit forest is grown like an extra fold drawing from every row
+    samples = [train for train, _ in folds] + ([None] if refit else [])
+    rates = [(example, attr) for example in grid['example_subsample_rate']
+             for attr in grid['attr_subsample_rate']]
+    seeds = np.random.SeedSequence(random_state).spawn(max(grid['num_trees']))
+    max_depth = max(grid['depth_limit'])
+    tasks = [(seed, max_depth, example, attr, rows)
+             for example, attr in rates for rows in samples for seed in seeds]
+    presorted = _presort(features)
+    workers = min(_n_workers(n_jobs), len(tasks))
+    if workers == 1:
+        fitted = [_fit_bootstrap_tree(features, classes, presorted, *task) for task in tasks]
+    else:
+        with _SharedArray(features) as shared_features, _SharedArray(classes) as shared_classes, \
+                _SharedArray(presorted) as shared_presorted:
+            specs = (shared_features.spec, shared_classes.spec, shared_presorted.spec)
+            with ProcessPoolExecutor(workers, initializer=_attach_shared, initargs=specs) as pool:
+                futures = [pool.submit(_fit_shared_bootstrap_tree, *task) for task in tasks]
+                fitted = [future.result() for future in futures]
+    flat_trees = np.empty((len(rates), len(samples), len(seeds)), dtype=object)
+    attributes = np.empty_like(flat_trees)
+    for i, (flat_tree, attribute_indices, _) in enumerate(fitted):
+        flat_trees.flat[i], attributes.flat[i] = flat_tree, attribute_indices
+
+    scores = {}
+    for r, (example, attr) in enumerate(rates):
+        for f, (_, test) in enumerate(folds):
+            # running vote totals of the first t trees, per depth limit
+            counts = np.zeros((len(grid['depth_limit']), len(test), len(labels)))
+            for t, flat_tree in enumerate(flat_trees[r, f]):
+                for d, depth_limit in enumerate(grid['depth_limit']):
+                    votes = np.searchsorted(labels, flat_tree.truncate(depth_limit).predict(features[test]))
+                    counts[d, np.arange(len(test)), votes] += 1
+                if t + 1 not in grid['num_trees']:
+                    continue
+                for d, depth_limit in enumerate(grid['depth_limit']):
+                    output = _majority_vote(counts[d], labels)
+                    params = (t + 1, depth_limit, example, attr)
+                    metrics = classification_metrics(output, classes[test], labels)
+                    scores.setdefault(params, []).append(metrics[scoring])
+
+    results = [{'params': dict(zip(_GRID_PARAMS, params)), 'scores': fold_scores,
+                'mean': float(np.mean(fold_scores)), 'std': float(np.std(fold_scores))}
+               for params, fold_scores in scores.items()]
+    # ties go to the first grid point: lowest rates, then fewest and shallowest trees
+    best = max(results, key=lambda result: result['mean'])
+    search = {'results': results, 'best_params': best['params'], 'best_score': best['mean']}
+    if refit:
+        params = best['params']
+        forest = RandomForest(n_jobs=n_jobs, random_state=random_state, **params)
+        forest.classes_ = labels
+        r = rates.index((params['example_subsample_rate'], params['attr_subsample_rate']))
+        for t in range(params['num_trees']):
+            tree = DecisionTree(params['depth_limit'])
+            tree.tree_ = flat_trees[r, -1, t].truncate(params['depth_limit'])
+            forest.trees.append(tree)
+            forest.feature_indices_.append(attributes[r, -1, t])
+        search['best_estimator'] = forest
+    return search
+
+
+# Binary model files start with this magic and a format version, followed
+# by a JSON header and the concatenated node arrays of every tree, each
+# aligned so it can be memory-mapped in place.
+_MODEL_MAGIC = b'DTMODEL\x00'
+_MODEL_VERSION = 1
+_MODEL_ALIGN = 64
+_NODE_ARRAYS = (('feature', '<i8'), ('threshold', '<f8'), ('left', '<i8'), ('right', '<i8'),
+                ('value', '<f8'))
+
+
+def _aligned(offset):
+    """Round offset up to the next multiple of _MODEL_ALIGN."""
+
+    return -(-offset // _MODEL_ALIGN) * _MODEL_ALIGN
+
+
+def _plain(value):
+    """json.dumps hook: numpy scalars and arrays as plain Python values."""
+
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def save_model(model, path):
+    """Save a fitted DecisionTree, RandomForest or ChallengeClassifier.
+    Args:
+        model: fitted model.
+        path (str): file to write.
+    """
+
+    if isinstance(model, RandomForest):
+        trees = [tree.tree_ for tree in model.trees]
+        classes = model.classes_
+    else:
+        trees = [model.tree_]
+        classes = model.tree_.classes
+    params = {name: getattr(model, name)
+              for name in inspect.signature(type(model).__init__).parameters if name != 'self'}
+    arrays = [(name, np.concatenate([getattr(tree, name) for tree in trees]).astype(dtype))
+              for name, dtype in _NODE_ARRAYS]
+    arrays.append(('classes', np.asarray(classes)))
+    header = {'model': type(model).__name__, 'params': params,
+              'tree_sizes': [len(tree.left) for tree in trees], 'arrays': {}}
+    if isinstance(model, RandomForest) and model.feature_indices_:
+        arrays.append(('feature_indices', np.concatenate(model.feature_indices_).astype(np.int64)))
+        header['feature_counts'] = [len(indices) for indices in model.feature_indices_]
+    offset = 0
+    for name, array in arrays:
+        offset = _aligned(offset)
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+        offset += array.nbytes
+    # parameters may hold numpy scalars, e.g. from a grid_search_forest grid
+    header_bytes = json.dumps(header, default=_plain).encode()
+    data_start = _aligned(len(_MODEL_MAGIC) + 8 + len(header_bytes))
+
+    with open(path, 'wb') as handle:
+        handle.write(_MODEL_MAGIC + struct.pack('<II', _MODEL_VERSION, len(header_bytes)))
+        handle.write(header_bytes)
+        for name, array in arrays:
+            handle.seek(data_start + header['arrays'][name]['offset'])
+            handle.write(np.ascontiguousarray(array).tobytes())
+        handle.truncate(data_start + offset)
+
+
+def load_model(path, mmap=True):
+    """Load a model written by save_model.
+    Args:
+        path (str): file to read.
+        mmap (bool): memory-map the node arrays read-only instead of reading
+            them, so loading is near-instant and worker processes loading
+            the same file share its pages.
+    Returns:
+        The fitted model.
+    """
+
+    with open(path, 'rb') as handle:
+        prefix = handle.read(len(_MODEL_MAGIC) + 8)
+        if prefix[:len(_MODEL_MAGIC)] != _MODEL_MAGIC:
+            raise ValueError('{} is not a saved model'.format(path))
+        version, header_length = struct.unpack('<II', prefix[len(_MODEL_MAGIC):])
+        if version != _MODEL_VERSION:
+            raise ValueError('unsupported model format version {}'.format(version))
+        header = json.loads(handle.read(header_length))
+    data_start = _aligned(len(_MODEL_MAGIC) + 8 + header_length)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+        if not mmap or not np.prod(shape):
+            arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                                       offset=data_start + spec['offset']).reshape(shape)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=data_start + spec['offset'],
+                                     shape=shape)
+    bounds = np.cumsum([0] + header['tree_sizes'])
+    trees = [_FlatTree(*[arrays[name][start:end] for name, _ in _NODE_ARRAYS], arrays['classes'])
+             for start, end in zip(bounds[:-1], bounds[1:])]
+
+    model_class = {cls.__name__: cls for cls in (DecisionTree, RandomForest, ChallengeClassifier)}
+    model = model_class[header['model']](**header['params'])
+    if isinstance(model, RandomForest):
+        model.classes_ = arrays['classes']
+        if 'feature_counts' in header:
+            bounds = np.cumsum([0] + header['feature_counts'])
+            model.feature_indices_ = [arrays['feature_indices'][start:end]
+                                      for start, end in zip(bounds[:-1], bounds[1:])]
+        for flat_tree in trees:
+            tree = DecisionTree(model.depth_limit)
+            tree.tree_ = flat_tree
+            model.trees.append(tree)
+    else:
+        model.tree_ = trees[0]
+    return model
 
 
 class Vectorization:
-    """Vectorization preparation for Assignment 5."""
+    """Vectorization preparation for Assignment 5.
+    Every kernel comes as a loop and a vectorized version. benchmark()
+    times each pair over array shapes and dtypes, checks that both agree
+    and reports the speedup and peak memory, as a canary for the numpy
+    build and BLAS configuration.
+    """
+
+    # Kernel pairs timed by benchmark(): name -> (loop method, vectorized
+    # method, how results are compared).
+    KERNELS = {
+        'loops': ('non_vectorized_loops', 'vectorized_loops', 'close'),
+        'loops_inplace': ('non_vectorized_loops', 'vectorized_loops_inplace', 'close'),
+        'loops_update': ('non_vectorized_loops', 'vectorized_loops_update', 'close'),
+        'slice': ('non_vectorized_slice', 'vectorized_slice', 'close'),
+        'flatten': ('non_vectorized_flatten', 'vectorized_flatten', 'counts'),
+        'flatten_positive': ('non_vectorized_flatten', 'vectorized_flatten_positive', 'counts'),
+        'masked_sum': ('non_vectorized_masked_sum', 'vectorized_masked_sum', 'close'),
+        'histogram': ('non_vectorized_histogram', 'vectorized_histogram', 'close'),
+        'pairwise_distances': ('non_vectorized_pairwise_distances',
+                               'vectorized_pairwise_distances', 'close'),
+    }
+
+    # Vectorized methods that overwrite their input; benchmark() hands every
+    # run a fresh copy of the data.
+    IN_PLACE = {'vectorized_loops_update'}
+
+    # Elements processed per step by the chunked kernels; bounds their
+    # scratch memory whatever the size of the data.
+    CHUNK = 1 << 16
 
     def __init__(self):
         pass
@@ -538,6 +2798,40 @@ class Vectorization:
         return vectorized
         raise NotImplemented()
 
+    def vectorized_loops_inplace(self, data, out=None):
+        """Element wise data * data + data without full-size temporaries.
+        Writes straight into out: the only full-size allocation is the
+        result itself when out is None, and none when out is given. With
+        out=data the array is updated in place, as data * (data + 1)
+        computed CHUNK elements at a time (in memory order, whatever the
+        layout) through one small scratch buffer.
+        Args:
+            data: array.
+            out: optional array of data's shape to write to; may be data.
+        Returns:
+            out.
+        """
+
+        if out is None:
+            out = np.empty_like(data)
+        if not np.shares_memory(out, data):
+            np.multiply(data, data, out=out)
+            return np.add(out, data, out=out)
+        if out.strides != data.strides or out.ctypes.data != data.ctypes.data:
+            raise ValueError('out must either be data or not overlap it')
+        scratch = np.empty(min(self.CHUNK, out.size), dtype=out.dtype)
+        with np.nditer(out, flags=['external_loop', 'buffered', 'zerosize_ok'],
+                       op_flags=[['readwrite']], buffersize=self.CHUNK, order='K') as blocks:
+            for block in blocks:
+                plus_one = np.add(block, 1, out=scratch[:len(block)])
+                np.multiply(block, plus_one, out=block)
+        return out
+
+    def vectorized_loops_update(self, data):
+        """vectorized_loops_inplace(data, out=data): overwrite data in place."""
+
+        return self.vectorized_loops_inplace(data, out=data)
+
     def non_vectorized_slice(self, data):
         """Find row with max sum using loops.
         This function searches through the first 100 rows, looking for the row
@@ -616,6 +2910,206 @@ class Vectorization:
         return new_dict
         raise NotImplemented()
 
+    def vectorized_flatten_positive(self, data):
+        """Count occurrences of positive numbers, filtering before counting.
+        Same result as vectorized_flatten without sorting the whole array
+        or looping in Python. The positive values are gathered once into a
+        buffer of their exact size, using chunk-sized masks only. Integers
+        in a range no larger than that are then counted with one bincount;
+        other data is sorted and counted at run boundaries.
+        Args:
+            data: data to be added to array.
+        Returns:
+            List of occurrences [(integer, number of occurrences), ...]
+        """
+
+        flattened = np.asarray(data).ravel(order='K')
+        chunks = range(0, flattened.size, self.CHUNK)
+        n_positive = sum(np.count_nonzero(flattened[start:start + self.CHUNK] > 0)
+                         for start in chunks)
+        if not n_positive:
+            return []
+        positives = np.empty(n_positive, dtype=flattened.dtype)
+        filled = 0
+        for start in chunks:
+            block = flattened[start:start + self.CHUNK]
+            block = block[block > 0]
+            positives[filled:filled + len(block)] = block
+            filled += len(block)
+        if np.issubdtype(positives.dtype, np.integer):
+            high = int(positives.max())
+            if high < max(n_positive, self.CHUNK):
+                counts = np.bincount(positives, minlength=high + 1)
+                values = np.flatnonzero(counts)
+                return list(zip(values.astype(positives.dtype), counts[values]))
+        positives.sort()
+        starts = np.flatnonzero(np.concatenate(([True], positives[1:] != positives[:-1])))
+        counts = np.diff(np.append(starts, len(positives)))
+        return list(zip(positives[starts], counts))
+
+    def non_vectorized_masked_sum(self, data):
+        """Sum the positive entries of every row using loops.
+        Args:
+            data: 2d array.
+        Returns:
+            Numpy array of one sum per row.
+        """
+
+        sums = np.zeros(data.shape[0])
+        for row in range(data.shape[0]):
+            for col in range(data.shape[1]):
+                if data[row][col] > 0:
+                    sums[row] += data[row][col]
+        return sums
+
+    def vectorized_masked_sum(self, data):
+        """Sum the positive entries of every row using vectorization.
+        The mask is passed as where= so no masked copy of data is made.
+        Args:
+            data: 2d array.
+        Returns:
+            Numpy array of one sum per row.
+        """
+
+        return np.sum(data, axis=1, where=data > 0, dtype=float)
+
+    def non_vectorized_histogram(self, data, n_bins=10):
+        """Count values in n_bins equal-width bins using loops.
+        Bins span data.min() to data.max(); the last bin includes the max.
+        Args:
+            data: array of values.
+            n_bins (int): number of bins.
+        Returns:
+            Numpy array of counts per bin.
+        """
+
+        flattened = np.ravel(data)
+        low, high = flattened.min(), flattened.max()
+        width = (high - low) / n_bins or 1
+        counts = np.zeros(n_bins, dtype=np.int64)
+        for item in range(len(flattened)):
+            counts[min(int((flattened[item] - low) / width), n_bins - 1)] += 1
+        return counts
+
+    def vectorized_histogram(self, data, n_bins=10):
+        """Count values in n_bins equal-width bins using vectorization.
+        Args:
+            data: array of values.
+            n_bins (int): number of bins.
+        Returns:
+            Numpy array of counts per bin.
+        """
+
+        flattened = np.ravel(data)
+        low, high = flattened.min(), flattened.max()
+        width = (high - low) / n_bins or 1
+        bins = ((flattened - low) / width).astype(np.int64)
+        return np.bincount(np.minimum(bins, n_bins - 1), minlength=n_bins)
+
+    def non_vectorized_pairwise_distances(self, data):
+        """Euclidean distances between the first 100 rows using loops.
+        Args:
+            data: 2d array.
+        Returns:
+            Numpy array (100 x 100) of distances.
+        """
+
+        rows = min(100, data.shape[0])
+        distances = np.zeros((rows, rows))
+        for i in range(rows):
+            for j in range(i + 1, rows):
+                total = 0.0
+                for col in range(data.shape[1]):
+                    difference = float(data[i][col]) - float(data[j][col])
+                    total += difference * difference
+                distances[i][j] = distances[j][i] = total ** 0.5
+        return distances
+
+    def vectorized_pairwise_distances(self, data):
+        """Euclidean distances between the first 100 rows using vectorization.
+        Uses |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, so the work is one matrix
+        product (BLAS).
+        Args:
+            data: 2d array.
+        Returns:
+            Numpy array (100 x 100) of distances.
+        """
+
+        rows = np.asarray(data[:100], dtype=float)
+        norms = np.einsum('ij,ij->i', rows, rows)
+        squared = norms[:, None] + norms[None, :] - 2 * rows @ rows.T
+        np.fill_diagonal(squared, 0)
+        return np.sqrt(np.maximum(squared, 0))
+
+    def _measure(self, function, data, repeat, fresh=False):
+        """Best time of function(data) over repeat runs and its peak memory.
+        With fresh, every run gets its own copy of data, made untimed.
+        Returns:
+            Tuple (result, seconds, peak bytes).
+        """
+
+        seconds = float('inf')
+        for _ in range(repeat):
+            work = data.copy() if fresh else data
+            start = time.perf_counter()
+            result = function(work)
+            seconds = min(seconds, time.perf_counter() - start)
+        work = data.copy() if fresh else data
+        tracemalloc.start()
+        try:
+            function(work)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result, seconds, peak
+
+    def _agree(self, expected, actual, comparison, dtype):
+        """Check a vectorized result against the loop result."""
+
+        if comparison == 'counts':
+            return dict(expected) == {key: count for key, count in actual}
+        tolerance = 1e-4 if np.dtype(dtype).itemsize < 8 else 1e-7
+        if not isinstance(expected, tuple):
+            expected, actual = (expected,), (actual,)
+        return all(np.allclose(e, a, rtol=tolerance, atol=tolerance)
+                   for e, a in zip(expected, actual))
+
+    def benchmark(self, shapes=((100, 100), (300, 300)), dtypes=('float64', 'float32', 'int64'),
+                  kernels=None, repeat=3, seed=0):
+        """Time and verify every kernel pair.
+        Args:
+            shapes (list): 2d array shapes (at least 100 rows).
+            dtypes (list): dtypes of the data.
+            kernels (list): names from KERNELS, by default all.
+            repeat (int): timed runs per kernel; the best counts.
+            seed (int): seed of the random data.
+        Returns:
+            List of dicts with kernel, shape, dtype, loop_seconds,
+            vectorized_seconds, speedup, equal, loop_peak_bytes and
+            vectorized_peak_bytes.
+        """
+
+        rng = np.random.default_rng(seed)
+        results = []
+        for shape in shapes:
+            for dtype in dtypes:
+                if np.issubdtype(dtype, np.integer):
+                    data = rng.integers(-50, 50, shape).astype(dtype)
+                else:
+                    data = (rng.normal(size=shape) * 10).astype(dtype)
+                for name in kernels or self.KERNELS:
+                    loop, vectorized, comparison = self.KERNELS[name]
+                    expected, loop_seconds, loop_peak = self._measure(getattr(self, loop), data,
+                                                                      repeat)
+                    actual, seconds, peak = self._measure(getattr(self, vectorized), data, repeat,
+                                                          vectorized in self.IN_PLACE)
+                    results.append({'kernel': name, 'shape': tuple(shape), 'dtype': str(dtype),
+                                    'loop_seconds': loop_seconds, 'vectorized_seconds': seconds,
+                                    'speedup': loop_seconds / seconds,
+                                    'equal': bool(self._agree(expected, actual, comparison, dtype)),
+                                    'loop_peak_bytes': loop_peak, 'vectorized_peak_bytes': peak})
+        return results
+
 def return_your_name():
     return "Adithi Minnasandran"
     raise NotImplemented()